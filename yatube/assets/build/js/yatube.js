@@ -0,0 +1,11 @@
+// "Show more comments" links replace themselves with the next page of the thread.
+document.addEventListener('click', function (event) {
+    var more = event.target.closest('.comments-more');
+    if (!more) {
+        return;
+    }
+    event.preventDefault();
+    fetch(more.dataset.url, {credentials: 'same-origin'})
+        .then(function (response) { return response.text(); })
+        .then(function (fragment) { more.outerHTML = fragment; });
+});
@@ -1,16 +1,161 @@
-from django.contrib import admin
+from datetime import datetime
 
-from .models import Post, Group
+from django import forms
+from django.contrib import admin, messages
+from django.contrib.admin.helpers import ACTION_CHECKBOX_NAME, ActionForm
+from django.core.exceptions import ValidationError
+from django.template.response import TemplateResponse
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.http import urlencode
+
+from yatube.batches import delete_in_batches
+
+from .bulk import move_to_group
+from .models import Comment, Follow, Group, Post
+from .paginator import EstimatedCountPaginator
+from .search import search_posts
+from .tasks import run_in_background
+
+
+class AutocompleteFilter(admin.FieldListFilter):
+    """Filter on a relation picked through the admin autocomplete, not from a list of every row."""
+    template = 'admin/autocomplete_filter.html'
+
+    def __init__(self, field, request, params, model, model_admin, field_path):
+        self.lookup_kwarg = f'{field_path}__{field.target_field.name}__exact'
+        self.lookup_val = params.get(self.lookup_kwarg)
+        super().__init__(field, request, params, model, model_admin, field_path)
+        self.autocomplete_url = reverse('admin:autocomplete') + '?' + urlencode({
+            'app_label': field.model._meta.app_label,
+            'model_name': field.model._meta.model_name,
+            'field_name': field.name,
+        })
+
+    def has_output(self):
+        return True
+
+    def expected_parameters(self):
+        return [self.lookup_kwarg]
+
+    def selected(self):
+        if not self.lookup_val:
+            return None
+        try:
+            return self.field.remote_field.model._default_manager.filter(pk=self.lookup_val).first()
+        except (ValueError, ValidationError):
+            return None
+
+    def choices(self, changelist):
+        yield {
+            'selected': self.selected(),
+            'query_string': changelist.get_query_string(remove=[self.lookup_kwarg]),
+            'hidden': [(name, value) for name, value in changelist.params.items()
+                       if name not in (self.lookup_kwarg, 'p')],
+        }
+
+
+class IndexedDateFilter(admin.DateFieldListFilter):
+    """The stock date ranges plus a link per year; every choice is a range scan on the date index."""
+
+    def __init__(self, field, request, params, model, model_admin, field_path):
+        super().__init__(field, request, params, model, model_admin, field_path)
+        dates = model._default_manager.exclude(**{f'{field_path}__isnull': True}).values_list(field_path, flat=True)
+        first, last = dates.order_by(field_path).first(), dates.order_by(f'-{field_path}').first()
+        if first is None:
+            return
+        years = range(timezone.localtime(last).year, timezone.localtime(first).year - 1, -1)
+        self.links += tuple((str(year), {self.lookup_kwarg_since: str(timezone.make_aware(datetime(year, 1, 1))),
+                                         self.lookup_kwarg_until: str(timezone.make_aware(datetime(year + 1, 1, 1)))})
+                            for year in years)
+
+
+# Picked for a plain "pub_date" entry in list_filter.
+admin.FieldListFilter.register(lambda field: field is Post._meta.get_field('pub_date'), IndexedDateFilter,
+                               take_priority=True)
+
+
+class LargeTableAdmin(admin.ModelAdmin):
+    """Changelists, filters and bulk actions that stay cheap with millions of rows."""
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    actions = ['delete_in_background']
+
+    def get_actions(self, request):
+        actions = super().get_actions(request)
+        # The stock action loads and lists every selected row before deleting it.
+        actions.pop('delete_selected', None)
+        return actions
+
+    @admin.action(permissions=['delete'], description='Delete selected %(verbose_name_plural)s in the background')
+    def delete_in_background(self, request, queryset):
+        if request.POST.get('post') != 'yes':
+            opts = self.model._meta
+            return TemplateResponse(request, 'admin/bulk_delete_confirmation.html', {
+                **self.admin_site.each_context(request),
+                'title': 'Are you sure?',
+                'opts': opts,
+                'sample': queryset[:20],
+                'count': self.get_paginator(request, queryset, 1).count,
+                'select_across': request.POST.get('select_across', '0'),
+                'selected': request.POST.getlist(ACTION_CHECKBOX_NAME),
+                'action_checkbox_name': ACTION_CHECKBOX_NAME,
+                'query_string': request.GET.urlencode(),
+            })
+        run_in_background(delete_in_batches, queryset)
+        self.message_user(request, f'Deleting {self.model._meta.verbose_name_plural} in the background.',
+                          messages.SUCCESS)
+
+
+class PostActionForm(ActionForm):
+    group = forms.ModelChoiceField(Group.objects.all(), required=False, empty_label='No group')
 
 
 @admin.register(Post)
-class PostAdmin(admin.ModelAdmin):
+class PostAdmin(LargeTableAdmin):
     list_display = ("pk", "author", "group", "text", "pub_date")
+    list_select_related = ("author", "group")
     search_fields = ("text",)
-    list_filter = ("pub_date", "group")
+    list_filter = ("pub_date", ("author", AutocompleteFilter), ("group", AutocompleteFilter))
+    ordering = ("-pub_date", "-id")
+    autocomplete_fields = ("author", "group")
+    action_form = PostActionForm
+    actions = ['delete_in_background', 'move_to_group']
+
+    def get_search_results(self, request, queryset, search_term):
+        if not search_term.strip():
+            return queryset, False
+        return queryset.filter(pk__in=search_posts(search_term).values('pk')), False
+
+    @admin.action(permissions=['change'], description='Move selected posts to the group in the background')
+    def move_to_group(self, request, queryset):
+        try:
+            group = self.action_form.base_fields['group'].clean(request.POST.get('group'))
+        except ValidationError:
+            self.message_user(request, 'Choose an existing group.', messages.ERROR)
+            return
+        run_in_background(move_to_group, queryset, group)
+        self.message_user(request, f'Moving posts to {group or "no group"} in the background.', messages.SUCCESS)
 
 
 @admin.register(Group)
 class GroupAdmin(admin.ModelAdmin):
     list_display = ("pk", "title", "description")
-    search_fields = ("title", "description")
\ No newline at end of file
+    search_fields = ("title", "description")
+
+
+@admin.register(Comment)
+class CommentAdmin(LargeTableAdmin):
+    list_display = ("pk", "post_id", "author", "text", "date_created")
+    list_select_related = ("author",)
+    list_filter = (("author", AutocompleteFilter),)
+    raw_id_fields = ("post",)
+    autocomplete_fields = ("author",)
+
+
+@admin.register(Follow)
+class FollowAdmin(LargeTableAdmin):
+    list_display = ("pk", "user", "author")
+    list_select_related = ("user", "author")
+    list_filter = (("user", AutocompleteFilter), ("author", AutocompleteFilter))
+    autocomplete_fields = ("user", "author")
@@ -0,0 +1,278 @@
+"""
+Read-only JSON API mirroring the feed pages.
+
+Every list is cursor-paginated like the HTML feeds; ``fields=`` picks the
+post fields to return and only those columns are loaded; ``export=1``
+streams the whole feed as one JSON document, a page-sized range query at a
+time. Responses carry a strong ETag built from the versions of the feed's
+cache scopes, which the signals bump on every change, and a Last-Modified
+of the newest ``pub_date``. A conditional GET that matches costs a single
+indexed query for Last-Modified and renders nothing.
+"""
+import hashlib
+import json
+from functools import wraps
+
+from django.contrib.auth import get_user_model
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Max
+from django.http import Http404, JsonResponse, StreamingHttpResponse
+from django.shortcuts import get_object_or_404
+from django.urls import reverse
+from django.views.decorators.http import condition
+
+from yatube.db import read_replica
+
+from .budgets import budget
+from .cache import (cache_feed, follow_scopes, group_scopes, index_scopes, post_view_scopes, profile_scopes,
+                    scope_versions)
+from .feeds import follow_feed
+from .models import AuthorStats, Comment, FeedEntry, Group, Post
+from .paginator import CursorPaginator
+from .views import comment_pagination
+
+User = get_user_model()
+
+VERSION = '1'
+PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+EXPORT_BATCH_SIZE = 500
+
+# Field name -> columns it needs, relative to Post.
+FIELDS = {
+    'id': [],
+    'text': ['text'],
+    'pub_date': [],
+    'author': ['author__username'],
+    'group': ['group__slug'],
+    'image': ['image'],
+    'comment_count': ['comment_count'],
+    'url': ['author__username'],
+}
+DEFAULT_FIELDS = list(FIELDS)
+
+
+class BadRequest(Exception):
+    pass
+
+
+def serialize_post(post, fields):
+    values = {
+        'id': lambda: post.id,
+        'text': lambda: post.text,
+        'pub_date': lambda: post.pub_date,
+        'author': lambda: post.author.username,
+        'group': lambda: post.group.slug if post.group_id else None,
+        'image': lambda: post.image.url if post.image else None,
+        'comment_count': lambda: post.comment_count,
+        'url': lambda: reverse('post', args=[post.author.username, post.id]),
+    }
+    return {name: values[name]() for name in fields}
+
+
+def requested_fields(request):
+    names = [name for name in request.GET.get('fields', '').split(',') if name]
+    unknown = set(names) - set(FIELDS)
+    if unknown:
+        raise BadRequest(f'Unknown fields: {", ".join(sorted(unknown))}')
+    return names or DEFAULT_FIELDS
+
+
+def sparse(queryset, fields, prefix=''):
+    """Load only the columns ``fields`` need, joining author and group only when asked for."""
+    columns = {'id', 'pub_date', 'author', 'group'}
+    for name in fields:
+        columns.update(FIELDS[name])
+    related = [name for name in ('author', 'group') if any(column.startswith(f'{name}__') for column in columns)]
+    if prefix:
+        related = [f'{prefix}{name}' for name in related] or [prefix.rstrip('_')]
+    return (queryset.select_related(*related)
+            .only(*(f'{prefix}{column}' for column in columns), *(['pub_date'] if prefix else [])))
+
+
+def page_size(request):
+    try:
+        return max(1, min(int(request.GET.get('limit', PAGE_SIZE)), MAX_PAGE_SIZE))
+    except ValueError:
+        raise BadRequest('limit must be a number')
+
+
+def page_url(request, cursor):
+    if cursor is None:
+        return None
+    query = request.GET.copy()
+    query['cursor'] = cursor
+    return request.build_absolute_uri(f'{request.path}?{query.urlencode()}')
+
+
+def export(paginator, fields, header):
+    """Yield the whole feed as a JSON document, one page-sized query at a time."""
+    encoder = DjangoJSONEncoder()
+    yield json.dumps(header, cls=DjangoJSONEncoder)[:-1] + (', ' if header else '') + '"results": ['
+    cursor, first = None, True
+    while True:
+        page = paginator.page(cursor)
+        for post in page:
+            yield ('' if first else ', ') + encoder.encode(serialize_post(post, fields))
+            first = False
+        if not page.has_next():
+            break
+        cursor = page.next_cursor
+    yield ']}'
+
+
+def feed_response(request, queryset, ordering, transform=None, prefix='', header=None):
+    """Paginated or streamed list of posts, shaped by ``fields=``."""
+    header = header or {}
+    fields = requested_fields(request)
+    queryset = sparse(queryset, fields, prefix)
+    if request.GET.get('export') == '1':
+        paginator = CursorPaginator(queryset, EXPORT_BATCH_SIZE, ordering=ordering, transform=transform)
+        return StreamingHttpResponse(export(paginator, fields, header), content_type='application/json')
+    paginator = CursorPaginator(queryset, page_size(request), ordering=ordering, transform=transform)
+    page = paginator.get_page(request.GET.get('cursor'))
+    return JsonResponse({**header,
+                         'results': [serialize_post(post, fields) for post in page],
+                         'next': page_url(request, page.next_cursor),
+                         'previous': page_url(request, page.previous_cursor),
+                         })
+
+
+def etag(scopes):
+    """Changes whenever a signal invalidates one of the feed's scopes."""
+    def get_etag(request, *args, **kwargs):
+        parts = [VERSION, request.get_full_path(), *scope_versions(scopes(request, *args, **kwargs))]
+        return hashlib.md5('|'.join(parts).encode()).hexdigest()
+    return get_etag
+
+
+def newest(queryset):
+    return queryset.aggregate(newest=Max('pub_date'))['newest']
+
+
+def once_per_request(func):
+    """The ETag, Last-Modified and page cache all need the same lookups."""
+    attribute = f'_api_{func.__name__}'
+
+    @wraps(func)
+    def wrapper(request, *args, **kwargs):
+        if not hasattr(request, attribute):
+            setattr(request, attribute, func(request, *args, **kwargs))
+        return getattr(request, attribute)
+    return wrapper
+
+
+def api_view(scopes, last_modified):
+    """Conditional GET, cached 200s and JSON errors for an API view."""
+    scopes = once_per_request(scopes)
+
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            try:
+                return view(request, *args, **kwargs)
+            except BadRequest as error:
+                return JsonResponse({'detail': str(error)}, status=400)
+            except Http404:
+                return JsonResponse({'detail': 'Not found'}, status=404)
+        return condition(etag_func=etag(scopes), last_modified_func=last_modified)(cache_feed(scopes)(wrapper))
+    return decorator
+
+
+def json_login_required(view):
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if not request.user.is_authenticated:
+            return JsonResponse({'detail': 'Authentication required'}, status=401)
+        return view(request, *args, **kwargs)
+    return wrapper
+
+
+def index_modified(request):
+    return newest(Post.objects.all())
+
+
+def group_modified(request, slug):
+    return newest(Post.objects.filter(group__slug=slug))
+
+
+def profile_modified(request, username):
+    return newest(Post.objects.filter(author__username=username))
+
+
+def post_modified(request, username, post_id):
+    return newest(Post.objects.filter(author__username=username, id=post_id))
+
+
+@once_per_request
+def request_follow_feed(request):
+    return follow_feed(request.user)
+
+
+def follow_modified(request):
+    posts, _, _ = request_follow_feed(request)
+    return newest(posts)
+
+
+@read_replica
+@budget(queries=4, p95_ms=100)
+@api_view(index_scopes, index_modified)
+def index(request):
+    return feed_response(request, Post.objects.all(), ('-pub_date', '-id'))
+
+
+@read_replica
+@budget(queries=5, p95_ms=100)
+@api_view(group_scopes, group_modified)
+def group_posts(request, slug):
+    group = get_object_or_404(Group, slug=slug)
+    return feed_response(request, Post.objects.filter(group=group), ('-pub_date', '-id'),
+                         header={'group': {'slug': group.slug, 'title': group.title,
+                                           'description': group.description}})
+
+
+@read_replica
+@budget(queries=5, p95_ms=100)
+@api_view(profile_scopes, profile_modified)
+def profile(request, username):
+    author = get_object_or_404(User.objects.select_related('stats'), username=username)
+    stats = AuthorStats.for_user(author)
+    return feed_response(request, Post.objects.filter(author=author), ('-pub_date', '-id'),
+                         header={'author': {'username': author.username,
+                                            'posts_count': stats.posts_count,
+                                            'followers_count': stats.followers_count,
+                                            'following_count': stats.following_count}})
+
+
+@read_replica
+@budget(queries=5, p95_ms=100)
+@api_view(post_view_scopes, post_modified)
+def post_view(request, username, post_id):
+    fields = requested_fields(request)
+    post = get_object_or_404(sparse(Post.objects.filter(author__username=username), fields), id=post_id)
+    comments = comment_pagination(request, Comment.objects.filter(post=post).only('text', 'date_created',
+                                                                                  'author__username'))
+    next_url = None
+    if comments.has_next():
+        next_url = request.build_absolute_uri(
+            reverse('post_comments', args=[username, post_id]) + f'?format=json&cursor={comments.next_cursor}')
+    return JsonResponse({**serialize_post(post, fields),
+                         'comments': [{'id': comment.id,
+                                       'author': comment.author.username,
+                                       'text': comment.text,
+                                       'date_created': comment.date_created} for comment in comments],
+                         'comments_next': next_url,
+                         })
+
+
+@read_replica
+@budget(queries=7, p95_ms=100)
+@json_login_required
+@api_view(follow_scopes, follow_modified)
+def follow_index(request):
+    posts, ordering, transform = request_follow_feed(request)
+    if posts.model is FeedEntry:
+        # Timeline rows carry the post's pub_date, so the range scan stays on the timeline index.
+        return feed_response(request, FeedEntry.objects.filter(user=request.user), ordering, transform,
+                             prefix='post__')
+    return feed_response(request, posts, ordering, transform)
@@ -0,0 +1,162 @@
+"""
+Async versions of the read-heavy feed views, served when ``ASYNC_VIEWS`` is on.
+
+Django 4.0 has no async ORM API yet, so each lookup runs through
+``sync_to_async``; lookups that do not depend on each other are started
+together and run in parallel threads, each on its own connection.
+"""
+import asyncio
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth import get_user_model
+from django.contrib.auth.views import redirect_to_login
+from django.db import close_old_connections, connection
+from django.db.models import Subquery
+from django.http import Http404
+from django.shortcuts import render
+
+from yatube.db import read_replica
+
+from .budgets import budget
+from .cache import (cache_feed, index_scopes, group_scopes, profile_scopes, post_view_scopes, follow_scopes,
+                    group_exists, profile_exists, post_exists)
+from .feeds import follow_feed
+from .freshness import conditional
+from .models import AuthorStats, Comment, Follow, Group, Post
+from .paginator import approximate_count
+from .views import comment_pagination, pagination
+
+User = get_user_model()
+
+render_async = sync_to_async(render)
+
+
+def _in_transaction():
+    return connection.in_atomic_block
+
+
+async def gather(*lookups):
+    """
+    Run independent lookups concurrently and return their results in order.
+
+    Inside a transaction other connections cannot see its rows, so the
+    lookups then share the request's connection and run one after another.
+    """
+    if await sync_to_async(_in_transaction)():
+        return await sync_to_async(lambda: [lookup() for lookup in lookups])()
+
+    def isolated(lookup):
+        def run():
+            close_old_connections()
+            return lookup()
+        return sync_to_async(run, thread_sensitive=False)()
+
+    return await asyncio.gather(*(isolated(lookup) for lookup in lookups))
+
+
+def login_required(view):
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        if not await sync_to_async(lambda: request.user.is_authenticated)():
+            return redirect_to_login(request.get_full_path())
+        return await view(request, *args, **kwargs)
+    return wrapper
+
+
+def _first_or_404(queryset):
+    # Not first(): its ORDER BY id makes SQLite sort the joined rows.
+    obj = next(iter(queryset[:1]), None)
+    if obj is None:
+        raise Http404(f'No {queryset.model._meta.object_name} matches the given query.')
+    return obj
+
+
+@read_replica
+@budget(queries=5, p95_ms=150)
+@conditional(index_scopes)
+@cache_feed(index_scopes)
+async def index(request):
+    posts = Post.objects.select_related('author', 'group')
+    count = approximate_count('index', Post.objects.all())
+    (page, paginator), count = await gather(lambda: pagination(request, posts, 10), count)
+    paginator.count = count
+    return await render_async(request, 'index.html', {'page': page,
+                                                      'paginator': paginator,
+                                                      'title': 'Последние обновления на сайте',
+                                                      'index': True
+                                                      })
+
+
+@read_replica
+@budget(queries=6, p95_ms=150)
+@conditional(group_scopes, group_exists)
+@cache_feed(group_scopes)
+async def group_posts(request, slug):
+    # A scalar subquery rather than a join keeps the page on the group_id index.
+    posts = (Post.objects.filter(group_id=Subquery(Group.objects.filter(slug=slug).values('id')[:1]))
+             .select_related('author', 'group'))
+    group, (page, paginator) = await gather(
+        lambda: _first_or_404(Group.objects.filter(slug=slug)),
+        lambda: pagination(request, posts, 10),
+    )
+    paginator.count = await sync_to_async(approximate_count(f'group:{group.pk}', posts))()
+    return await render_async(request, 'group.html', {'group': group, 'page': page, 'paginator': paginator})
+
+
+@read_replica
+@budget(queries=6, p95_ms=150)
+@conditional(profile_scopes, profile_exists)
+@cache_feed(profile_scopes)
+async def profile(request, username):
+    posts = Post.objects.filter(author__username=username).select_related('author', 'group')
+    user = request.user
+    author, (page, paginator), following = await gather(
+        lambda: _first_or_404(User.objects.filter(username=username).select_related('stats')),
+        lambda: pagination(request, posts, 10),
+        lambda: user.is_authenticated and Follow.objects.filter(user=user, author__username=username).exists(),
+    )
+    stats = await sync_to_async(AuthorStats.for_user)(author)
+    paginator.count = stats.posts_count
+    return await render_async(request, 'profile.html', {'page': page,
+                                                        'paginator': paginator,
+                                                        'author': author,
+                                                        'stats': stats,
+                                                        'count': stats.posts_count,
+                                                        'following': following,
+                                                        })
+
+
+@budget(queries=6, p95_ms=150)
+@conditional(post_view_scopes, post_exists)
+async def post_view(request, username, post_id):
+    author, post, comments = await gather(
+        lambda: _first_or_404(User.objects.filter(username=username).select_related('stats')),
+        lambda: _first_or_404(Post.objects.filter(author__username=username, id=post_id).select_related('group')),
+        lambda: comment_pagination(request,
+                                   Comment.objects.filter(post_id=post_id, post__author__username=username)),
+    )
+    stats = await sync_to_async(AuthorStats.for_user)(author)
+    return await render_async(request, 'profile.html', {'author': author,
+                                                        'stats': stats,
+                                                        'post': post,
+                                                        'count': stats.posts_count,
+                                                        'items': comments
+                                                        })
+
+
+@read_replica
+@budget(queries=6, p95_ms=150)
+@login_required
+@cache_feed(follow_scopes)
+async def follow_index(request):
+    def load_page():
+        posts, ordering, transform = follow_feed(request.user)
+        return pagination(request, posts, 10, ordering=ordering, transform=transform)
+
+    page, paginator = await sync_to_async(load_page)()
+    return await render_async(request, 'index.html', {'page': page,
+                                                      'paginator': paginator,
+                                                      'title': 'Посты избранных авторов',
+                                                      'follow': True
+                                                      })
@@ -0,0 +1,373 @@
+"""
+Drive the main views under concurrent load and report latency, throughput,
+queries per request and peak memory. Requests go through the Django test
+client, over HTTP to a WSGI server started in this process, or through the
+ASGI handler with concurrent coroutines on one event loop, the way uvicorn
+serves it.
+
+``run_render`` times template rendering alone: a feed page of in-memory
+posts through the cached Django loader and through the Jinja2 ports.
+"""
+import asyncio
+import json
+import math
+import platform
+import random
+import resource
+import socketserver
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from contextlib import ExitStack
+from wsgiref.simple_server import WSGIRequestHandler, WSGIServer, make_server
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.core.handlers.wsgi import WSGIHandler
+from django.db import connections
+from django.http import HttpRequest
+from django.middleware.csrf import get_token
+from django.template.loader import render_to_string
+from django.test import AsyncClient, Client, RequestFactory, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from .cache import card_key
+from .models import AuthorStats, Group, Post
+from .paginator import CursorPage, CursorPaginator
+
+User = get_user_model()
+
+SCENARIOS = ('index', 'group_posts', 'profile', 'post_view', 'follow_index', 'new_post', 'add_comment',
+             'mixed')
+# Share of writes in the mixed scenario: readers and commenters on the same posts.
+MIXED_WRITE_RATIO = 0.3
+SAMPLE_SIZE = 500
+QUERY_COUNT_HEADER = 'X-Query-Count'
+TRANSPORTS = ('client', 'wsgi', 'asgi')
+TEMPLATE_ENGINES = ('django', 'jinja2')
+
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of an already sorted list."""
+    if not values:
+        return None
+    return values[max(0, math.ceil(fraction * len(values)) - 1)]
+
+
+class Dataset:
+    """Ids and names to build request URLs from, loaded once before the run."""
+
+    def __init__(self):
+        self.reader = User.objects.get(pk=AuthorStats.objects.order_by('-following_count', 'user_id')
+                                       .values_list('user_id', flat=True).first())
+        self.groups = list(Group.objects.order_by('id').values_list('slug', flat=True)[:SAMPLE_SIZE])
+        self.authors = list(AuthorStats.objects.filter(posts_count__gt=0).order_by('-posts_count', 'user_id')
+                            .values_list('user__username', flat=True)[:SAMPLE_SIZE])
+        self.posts = list(Post.objects.order_by('-pub_date', '-id')
+                          .values_list('author__username', 'id')[:SAMPLE_SIZE])
+        if not (self.groups and self.authors and self.posts):
+            raise ValueError('The database is empty, run generate_data first')
+
+    def request(self, scenario, rng):
+        """Return ``(method, url, data)`` for one request of ``scenario``."""
+        if scenario == 'mixed':
+            scenario = 'add_comment' if rng.random() < MIXED_WRITE_RATIO else 'post_view'
+        username, post_id = rng.choice(self.posts)
+        if scenario == 'index':
+            return 'GET', reverse('index'), None
+        if scenario == 'group_posts':
+            return 'GET', reverse('group', args=[rng.choice(self.groups)]), None
+        if scenario == 'profile':
+            return 'GET', reverse('profile', args=[rng.choice(self.authors)]), None
+        if scenario == 'post_view':
+            return 'GET', reverse('post', args=[username, post_id]), None
+        if scenario == 'follow_index':
+            return 'GET', reverse('follow'), None
+        if scenario == 'new_post':
+            return 'POST', reverse('new_post'), {'text': f'Benchmark post {rng.random()}'}
+        if scenario == 'add_comment':
+            return 'POST', reverse('add_comment', args=[username, post_id]), {'text': 'Benchmark comment'}
+        raise ValueError(f'Unknown scenario {scenario!r}')
+
+
+class ClientSession:
+    def __init__(self, user):
+        self.client = Client()
+        self.client.force_login(user)
+
+    def send(self, method, url, data):
+        with ExitStack() as stack:
+            captured = [stack.enter_context(CaptureQueriesContext(alias)) for alias in connections.all()]
+            response = self.client.post(url, data) if method == 'POST' else self.client.get(url)
+        return response.status_code, sum(len(queries) for queries in captured)
+
+    def close(self):
+        connections.close_all()
+
+
+class AsyncClientSession:
+    """Logged in up front: force_login is sync and must not run on the event loop."""
+
+    def __init__(self, user):
+        self.client = AsyncClient()
+        self.client.force_login(user)
+
+    async def send(self, method, url, data):
+        if method == 'POST':
+            response = await self.client.post(url, data)
+        else:
+            response = await self.client.get(url)
+        # Queries run in worker threads and cannot be attributed to a request.
+        return response.status_code, None
+
+
+class NoRedirect(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+class HTTPSession:
+    def __init__(self, user, base_url):
+        client = Client()
+        client.force_login(user)
+        request = HttpRequest()
+        token = get_token(request)
+        self.base_url = base_url
+        self.headers = {
+            'Cookie': f'{settings.SESSION_COOKIE_NAME}={client.cookies[settings.SESSION_COOKIE_NAME].value}; '
+                      f'{settings.CSRF_COOKIE_NAME}={request.META["CSRF_COOKIE"]}',
+            'X-CSRFToken': token,
+        }
+        self.opener = urllib.request.build_opener(NoRedirect)
+        connections.close_all()
+
+    def send(self, method, url, data):
+        body = urllib.parse.urlencode(data).encode() if data is not None else None
+        request = urllib.request.Request(self.base_url + url, data=body, headers=self.headers, method=method)
+        try:
+            with self.opener.open(request) as response:
+                response.read()
+                status, headers = response.status, response.headers
+        except urllib.error.HTTPError as error:
+            status, headers = error.code, error.headers
+        queries = headers.get(QUERY_COUNT_HEADER)
+        return status, int(queries) if queries is not None else None
+
+    def close(self):
+        pass
+
+
+def counting_app(app):
+    """Wrap a WSGI app to report the number of SQL queries in a response header."""
+    def wrapper(environ, start_response):
+        with ExitStack() as stack:
+            captured = [stack.enter_context(CaptureQueriesContext(alias)) for alias in connections.all()]
+
+            def counting_start_response(status, headers, exc_info=None):
+                count = sum(len(queries) for queries in captured)
+                return start_response(status, [*headers, (QUERY_COUNT_HEADER, str(count))], exc_info)
+            return app(environ, counting_start_response)
+    return wrapper
+
+
+class ThreadingWSGIServer(socketserver.ThreadingMixIn, WSGIServer):
+    daemon_threads = True
+
+
+class QuietHandler(WSGIRequestHandler):
+    def log_message(self, *args):
+        pass
+
+
+def start_wsgi_server(app=None):
+    server = make_server('127.0.0.1', 0, counting_app(app or WSGIHandler()),
+                         server_class=ThreadingWSGIServer, handler_class=QuietHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f'http://127.0.0.1:{server.server_port}'
+
+
+def run_threads(plan, make_session, concurrency, samples, errors):
+    lock = threading.Lock()
+
+    def worker(chunk):
+        session = make_session()
+        try:
+            for method, url, data in chunk:
+                started = time.perf_counter()
+                try:
+                    status, queries = session.send(method, url, data)
+                except Exception as error:
+                    status, queries = None, None
+                    with lock:
+                        errors.append(f'{url}: {error}')
+                elapsed_ms = (time.perf_counter() - started) * 1000
+                with lock:
+                    samples.append((elapsed_ms, status, queries))
+        finally:
+            session.close()
+
+    threads = [threading.Thread(target=worker, args=(plan[number::concurrency],)) for number in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+def run_coroutines(plan, make_session, concurrency, samples, errors):
+    sessions = [make_session() for _ in range(concurrency)]
+
+    async def worker(session, chunk):
+        for method, url, data in chunk:
+            started = time.perf_counter()
+            try:
+                status, queries = await session.send(method, url, data)
+            except Exception as error:
+                status, queries = None, None
+                errors.append(f'{url}: {error}')
+            samples.append(((time.perf_counter() - started) * 1000, status, queries))
+
+    async def main():
+        await asyncio.gather(*(worker(session, plan[number::concurrency]) for number, session in enumerate(sessions)))
+
+    asyncio.run(main())
+
+
+def run_scenario(scenario, dataset, make_session, requests, concurrency, seed, transport='client'):
+    rng = random.Random(f'{seed}:{scenario}')
+    plan = [dataset.request(scenario, rng) for _ in range(requests)]
+    samples, errors = [], []
+    started = time.perf_counter()
+    if transport == 'asgi':
+        run_coroutines(plan, make_session, concurrency, samples, errors)
+    else:
+        run_threads(plan, make_session, concurrency, samples, errors)
+    wall = time.perf_counter() - started
+
+    latencies = sorted(elapsed for elapsed, _, _ in samples)
+    queries = [count for _, _, count in samples if count is not None]
+    failed = [status for _, status, _ in samples if status is None or status >= 400]
+    return {
+        'requests': len(samples),
+        'errors': len(failed),
+        'error_samples': errors[:5],
+        'throughput_rps': round(len(samples) / wall, 2) if wall else None,
+        'latency_ms': {
+            'mean': round(sum(latencies) / len(latencies), 2) if latencies else None,
+            **{name: round(percentile(latencies, fraction), 2) if latencies else None
+               for name, fraction in (('p50', 0.5), ('p95', 0.95), ('p99', 0.99))},
+        },
+        'queries_per_request': {
+            'mean': round(sum(queries) / len(queries), 2) if queries else None,
+            'max': max(queries) if queries else None,
+        },
+    }
+
+
+def run(scenarios=SCENARIOS, requests=100, concurrency=4, seed=0, transport='client'):
+    """Run every scenario in turn and return the report as a dict."""
+    if transport not in TRANSPORTS:
+        raise ValueError(f'Unknown transport {transport!r}')
+    dataset = Dataset()
+    if transport == 'wsgi':
+        wsgi_server, base_url = start_wsgi_server()
+
+    def make_session():
+        if transport == 'wsgi':
+            return HTTPSession(dataset.reader, base_url)
+        if transport == 'asgi':
+            return AsyncClientSession(dataset.reader)
+        return ClientSession(dataset.reader)
+
+    try:
+        results = {scenario: run_scenario(scenario, dataset, make_session, requests, concurrency, seed, transport)
+                   for scenario in scenarios}
+    finally:
+        if transport == 'wsgi':
+            wsgi_server.shutdown()
+            wsgi_server.server_close()
+        connections.close_all()
+    return {
+        'config': {
+            'transport': transport,
+            'async_views': settings.ASYNC_VIEWS,
+            'requests': requests,
+            'concurrency': concurrency,
+            'seed': seed,
+            'database': settings.DATABASES['default']['ENGINE'],
+            'write_queue': settings.SQLITE_WRITE_QUEUE,
+            'python': platform.python_version(),
+        },
+        'results': results,
+        # ru_maxrss is in kilobytes on Linux.
+        'peak_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }
+
+
+def dumps(report):
+    return json.dumps(report, indent=2, sort_keys=True)
+
+
+def engine_templates(engine):
+    """TEMPLATES for one engine, parsing each template only once."""
+    django = {**settings.TEMPLATES[-1], 'APP_DIRS': False}
+    django['OPTIONS'] = {**django['OPTIONS'], 'loaders': settings.CACHED_TEMPLATE_LOADERS}
+    return [settings.JINJA2_TEMPLATES, django] if engine == 'jinja2' else [django]
+
+
+def feed_page(size=10):
+    """Context of an index page with ``size`` posts, built without the database."""
+    groups = [Group(id=number, title=f'Group {number}', slug=f'group-{number}') for number in range(3)]
+    posts = []
+    for number in range(size):
+        author = User(id=number + 1, username=f'author{number}')
+        posts.append(Post(id=number + 1, author=author, group=groups[number % 4] if number % 4 < 3 else None,
+                          text=f'Post {number}\n' + 'word ' * 80, pub_date=timezone.now(),
+                          comment_count=number % 3))
+    paginator = CursorPaginator(Post.objects.none(), size, count=1000)
+    return {'page': CursorPage(posts, paginator, next_cursor='next'), 'paginator': paginator,
+            'title': 'Последние обновления на сайте', 'index': True}
+
+
+def time_renders(context, request, renders, cold):
+    latencies = []
+    for _ in range(renders):
+        if cold:
+            cache.delete_many([card_key(post) for post in context['page']])
+        started = time.perf_counter()
+        render_to_string('index.html', context, request)
+        latencies.append((time.perf_counter() - started) * 1000)
+    latencies.sort()
+    return {
+        'mean': round(sum(latencies) / len(latencies), 3),
+        **{name: round(percentile(latencies, fraction), 3) for name, fraction in (('p50', 0.5), ('p95', 0.95))},
+    }
+
+
+def run_render(engines=TEMPLATE_ENGINES, renders=200, size=10):
+    """
+    Render the index page ``renders`` times per engine, with every card
+    rendered (cold) and with the cards from the cache (warm); milliseconds.
+    """
+    context = feed_page(size)
+    request = RequestFactory().get(reverse('index'))
+    request.user = AnonymousUser()
+    results = {}
+    for engine in engines:
+        with override_settings(TEMPLATES=engine_templates(engine)):
+            cache.delete_many([card_key(post) for post in context['page']])
+            render_to_string('index.html', context, request)
+            results[engine] = {
+                'cold_cards_ms': time_renders(context, request, renders, cold=True),
+                'cached_cards_ms': time_renders(context, request, renders, cold=False),
+            }
+        cache.delete_many([card_key(post) for post in context['page']])
+    return {
+        'config': {'renders': renders, 'posts': size, 'python': platform.python_version()},
+        'results': results,
+    }
@@ -0,0 +1,75 @@
+import logging
+import time
+import traceback
+from collections import defaultdict
+from dataclasses import dataclass
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connection
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class Budget:
+    queries: int
+    p95_ms: float
+
+
+def budget(queries, p95_ms):
+    """Declare how many queries and how much time (p95) a view may spend."""
+    def decorator(view):
+        view.query_budget = Budget(queries, p95_ms)
+        return view
+    return decorator
+
+
+def get_budget(view):
+    return getattr(view, 'query_budget', None)
+
+
+def call_site():
+    root = str(settings.BASE_DIR)
+    for frame in reversed(traceback.extract_stack()[:-2]):
+        if frame.filename.startswith(root) and not frame.filename.endswith('budgets.py'):
+            return f'{frame.filename[len(root) + 1:]}:{frame.lineno} in {frame.name}'
+    return 'unknown'
+
+
+class QueryBudgetMiddleware:
+    """
+    DEBUG-only: log requests that exceed the budget of their view, with the
+    offending SQL grouped by the line of project code that issued it.
+    """
+
+    def __init__(self, get_response):
+        if not settings.DEBUG:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        queries = []
+
+        def record(execute, sql, params, many, context):
+            queries.append((call_site(), sql))
+            return execute(sql, params, many, context)
+
+        started = time.perf_counter()
+        with connection.execute_wrapper(record):
+            response = self.get_response(request)
+        elapsed_ms = (time.perf_counter() - started) * 1000
+
+        limit = getattr(request, 'query_budget', None)
+        if limit and (len(queries) > limit.queries or elapsed_ms > limit.p95_ms):
+            by_site = defaultdict(list)
+            for site, sql in queries:
+                by_site[site].append(sql)
+            report = '\n'.join(f'  {len(statements)}x {site}\n    {statements[0]}'
+                               for site, statements in sorted(by_site.items(), key=lambda item: -len(item[1])))
+            logger.warning('%s exceeded its budget: %d queries (budget %d), %.1f ms (p95 budget %.0f ms)\n%s',
+                           request.path, len(queries), limit.queries, elapsed_ms, limit.p95_ms, report)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request.query_budget = get_budget(view_func)
@@ -0,0 +1,31 @@
+"""
+Bulk changes from the admin, run off the request path a batch at a time.
+
+Deletes use ``yatube.batches.delete_in_batches`` and go through the ORM and
+its signals like single-row deletes; moves use one UPDATE per batch and
+invalidate the caches the post_save signal would have.
+"""
+import logging
+
+from django.db import transaction
+
+from yatube.batches import batches
+
+from . import cache
+from .models import Post
+
+logger = logging.getLogger(__name__)
+
+
+def move_to_group(queryset, group, batch_size=None):
+    """Put the posts of ``queryset`` into ``group`` (None takes them out of their groups)."""
+    moved = 0
+    for ids in batches(queryset, batch_size):
+        with transaction.atomic():
+            posts = list(Post.objects.filter(pk__in=ids).select_related('author', 'group'))
+            moved += Post.objects.filter(pk__in=ids).update(group=group)
+            cache.invalidate(*{scope for post in posts
+                               for scope in cache.post_scopes(post, [group.slug if group else None])})
+        cache.invalidate_cards(posts)
+    logger.info('Moved %s posts to %s', moved, group)
+    return moved
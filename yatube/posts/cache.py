@@ -0,0 +1,213 @@
+import asyncio
+import hashlib
+import uuid
+from functools import wraps
+
+from asgiref.sync import async_to_sync, sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.http import HttpResponse
+
+from .feeds import is_celebrity
+from .freshness import touch
+from .models import Follow, Group, Post
+
+SCOPE_KEY = 'feed_scope:{}'
+PAGE_KEY = 'feed_page:{}:{}'
+CARD_KEY = 'post_card:{}:{}'
+
+User = get_user_model()
+
+
+def global_scope():
+    return 'global'
+
+
+def group_scope(slug):
+    return f'group:{slug}'
+
+
+def author_scope(username):
+    return f'author:{username}'
+
+
+def follow_scope(user_id):
+    return f'follow:{user_id}'
+
+
+def users_scope():
+    return 'users'
+
+
+def scope_key(scope):
+    return SCOPE_KEY.format(hashlib.md5(scope.encode()).hexdigest())
+
+
+def scope_versions(scopes):
+    keys = [scope_key(scope) for scope in scopes]
+    versions = cache.get_many(keys)
+    missing = {key: uuid.uuid4().hex for key in keys if key not in versions}
+    if missing:
+        cache.set_many(missing, None)
+        versions.update(missing)
+    return [versions[key] for key in keys]
+
+
+def invalidate(*scopes):
+    """
+    Drop the version of every scope so pages cached under it are never read
+    again, and move the last-modified time of the public ones.
+    """
+    cache.delete_many([scope_key(scope) for scope in set(scopes)])
+    touch(scopes)
+
+
+def page_key(request, name, scopes):
+    user = request.user.pk if request.user.is_authenticated else 'anonymous'
+    parts = [request.get_full_path(), str(user), *scope_versions(scopes)]
+    digest = hashlib.md5('|'.join(parts).encode()).hexdigest()
+    return PAGE_KEY.format(name, digest)
+
+
+def card_key(post):
+    """Rendered post cards are versioned by their comment count."""
+    return CARD_KEY.format(post.pk, post.comment_count)
+
+
+def invalidate_cards(posts):
+    cache.delete_many([card_key(post) for post in posts])
+
+
+def fetch(key, compute, timeout):
+    """
+    Read ``key`` or fill it with ``compute()``; None results are not cached.
+    A tiered cache coalesces concurrent misses and refreshes hot keys early.
+    """
+    get_or_compute = getattr(cache, 'get_or_compute', None)
+    if get_or_compute is not None:
+        return get_or_compute(key, compute, timeout)
+    value = cache.get(key)
+    if value is None:
+        value = compute()
+        if value is not None:
+            cache.set(key, value, timeout)
+    return value
+
+
+def cache_when_sent(chunks, key, content_type, timeout):
+    """
+    Pass a streamed page through and cache it once the last chunk is out,
+    as ``fetch`` would have. Streams longer than STREAM_CACHE_MAX_SIZE, such
+    as API exports, are not kept.
+    """
+    sent, size = [], 0
+    for chunk in chunks:
+        size += len(chunk)
+        if sent is not None and size <= settings.STREAM_CACHE_MAX_SIZE:
+            sent.append(chunk)
+        else:
+            sent = None
+        yield chunk
+    if sent is not None:
+        content = b''.join(sent)
+        fetch(key, lambda: (content, content_type), timeout)
+
+
+def cache_feed(scopes, timeout=None):
+    """
+    Cache a rendered feed page per user, keyed on the versions of the feed
+    scopes it shows. ``scopes(request, *args, **kwargs)`` returns the scope
+    names; signals invalidate them when the underlying rows change. Works
+    for both sync and async views, which share the cached pages.
+    """
+    def decorator(view):
+        def cached_view(call, request, *args, **kwargs):
+            key = page_key(request, view.__name__, scopes(request, *args, **kwargs))
+            rendered = None
+
+            def render():
+                nonlocal rendered
+                rendered = call(request, *args, **kwargs)
+                if rendered.status_code == 200 and not rendered.streaming:
+                    return rendered.content, rendered['Content-Type']
+                return None
+
+            cached = fetch(key, render, timeout or settings.FEED_CACHE_TIMEOUT)
+            if rendered is not None:
+                if rendered.status_code == 200 and rendered.streaming:
+                    rendered.streaming_content = cache_when_sent(rendered.streaming_content, key,
+                                                                 rendered['Content-Type'],
+                                                                 timeout or settings.FEED_CACHE_TIMEOUT)
+                return rendered
+            content, content_type = cached
+            return HttpResponse(content, content_type=content_type)
+
+        if asyncio.iscoroutinefunction(view):
+            @wraps(view)
+            async def async_wrapper(request, *args, **kwargs):
+                if request.method not in ('GET', 'HEAD'):
+                    return await view(request, *args, **kwargs)
+                # Waiting on another request's render blocks, so it happens off the event loop.
+                return await sync_to_async(cached_view)(async_to_sync(view), request, *args, **kwargs)
+            return async_wrapper
+
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return view(request, *args, **kwargs)
+            return cached_view(view, request, *args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def index_scopes(request):
+    return [global_scope()]
+
+
+def users_scopes(request):
+    return [users_scope()]
+
+
+def group_scopes(request, slug):
+    return [group_scope(slug)]
+
+
+def profile_scopes(request, username):
+    return [author_scope(username)]
+
+
+def post_view_scopes(request, username, post_id):
+    # Edits and comments invalidate the author's scope.
+    return [author_scope(username)]
+
+
+def group_exists(request, slug):
+    return Group.objects.filter(slug=slug).exists()
+
+
+def profile_exists(request, username):
+    return User.objects.filter(username=username).exists()
+
+
+def post_exists(request, username, post_id):
+    return Post.objects.filter(author__username=username, id=post_id).exists()
+
+
+def follow_scopes(request):
+    celebrities = (Follow.objects
+                   .filter(user=request.user, author__stats__followers_count__gt=settings.FEED_FANOUT_LIMIT)
+                   .values_list('author__username', flat=True))
+    return [follow_scope(request.user.pk), *(author_scope(username) for username in celebrities)]
+
+
+def post_scopes(post, group_slugs=()):
+    """Every feed scope a post card appears in."""
+    scopes = [global_scope(), author_scope(post.author.username)]
+    scopes.extend(group_scope(slug) for slug in group_slugs if slug)
+    if post.group_id:
+        scopes.append(group_scope(post.group.slug))
+    if not is_celebrity(post.author_id):
+        followers = Follow.objects.filter(author_id=post.author_id).values_list('user_id', flat=True)
+        scopes.extend(follow_scope(user_id) for user_id in followers)
+    return scopes
@@ -0,0 +1,51 @@
+from django.apps import apps as global_apps
+from django.conf import settings
+from django.db.models import Count, F, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+from .models import AuthorStats, Post
+
+
+def bump_comment_count(post_id, delta):
+    Post.objects.filter(pk=post_id).update(comment_count=F('comment_count') + delta)
+
+
+def bump_author_stats(user_id, **deltas):
+    changes = {name: F(name) + delta for name, delta in deltas.items()}
+    if not AuthorStats.objects.filter(user_id=user_id).update(**changes):
+        if any(delta < 0 for delta in deltas.values()):
+            # The row went with its user in a cascading delete; there is nothing left to count down.
+            return
+        AuthorStats.objects.get_or_create(user_id=user_id)
+        AuthorStats.objects.filter(user_id=user_id).update(**changes)
+
+
+def _count_of(model, field):
+    return Coalesce(
+        Subquery(model.objects.filter(**{field: OuterRef('pk')})
+                 .order_by()
+                 .values(field)
+                 .annotate(total=Count('pk'))
+                 .values('total')),
+        Value(0),
+    )
+
+
+def rebuild_counters(apps=global_apps):
+    """Recompute every denormalized counter from the source tables."""
+    User = apps.get_model(settings.AUTH_USER_MODEL)
+    Post = apps.get_model('posts', 'Post')
+    Comment = apps.get_model('posts', 'Comment')
+    Follow = apps.get_model('posts', 'Follow')
+    AuthorStats = apps.get_model('posts', 'AuthorStats')
+
+    Post.objects.update(comment_count=_count_of(Comment, 'post'))
+
+    missing = User.objects.filter(stats__isnull=True).values_list('pk', flat=True)
+    AuthorStats.objects.bulk_create((AuthorStats(user_id=pk) for pk in missing.iterator()),
+                                    batch_size=1000, ignore_conflicts=True)
+    AuthorStats.objects.update(
+        posts_count=_count_of(Post, 'author'),
+        followers_count=_count_of(Follow, 'author'),
+        following_count=_count_of(Follow, 'user'),
+    )
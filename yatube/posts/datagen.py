@@ -0,0 +1,152 @@
+"""
+Reproducible synthetic datasets for load tests and benchmarks.
+
+Authors are ranked and picked with Zipf-like weights, so a handful of
+accounts write most posts and collect most followers, and a few posts
+collect most comments -- close to what a real social feed looks like.
+Every user, group and image created is recorded in GeneratedObject, and
+``clear_generated`` removes only those (with the generated users' posts,
+comments and follows), never other accounts that happen to look alike.
+"""
+import random
+from datetime import timedelta
+from io import BytesIO
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models import BigIntegerField
+from django.db.models.functions import Cast
+from django.utils import timezone
+from PIL import Image
+
+from .counters import rebuild_counters
+from .feeds import rebuild_feeds
+from .freshness import touch_all
+from .models import Comment, Follow, GeneratedObject, Group, Post
+from .search import rebuild_index
+
+User = get_user_model()
+
+BATCH_SIZE = 1000
+USERNAME = 'bench{}'
+PASSWORD = 'benchmark-password'
+IMAGE_POOL_SIZE = 20
+
+
+def record(kind, keys):
+    GeneratedObject.objects.bulk_create((GeneratedObject(kind=kind, key=str(key)) for key in keys),
+                                        batch_size=BATCH_SIZE)
+
+
+def zipf_weights(size, exponent=1.1):
+    return [1 / (rank + 1) ** exponent for rank in range(size)]
+
+
+def make_images(rng, count):
+    names = []
+    for number in range(count):
+        content = BytesIO()
+        color = tuple(rng.randrange(256) for _ in range(3))
+        Image.new('RGB', (1280, 720), color).save(content, 'JPEG', quality=85)
+        names.append(default_storage.save(f'posts/generated-{number}.jpg', ContentFile(content.getvalue())))
+    return names
+
+
+def generate(users=1000, posts=10000, groups=20, comments=30000, follows=10000, image_ratio=0.1,
+             days=365, seed=0, stdout=None):
+    """
+    Create the dataset and rebuild counters and feeds. The same arguments
+    and seed always produce the same users, posts, comments and follow graph.
+    """
+    rng = random.Random(seed)
+    now = timezone.now()
+
+    def log(message):
+        if stdout is not None:
+            stdout.write(message)
+
+    with transaction.atomic():
+        password = make_password(PASSWORD)
+        offset = User.objects.count()
+        User.objects.bulk_create(
+            (User(username=USERNAME.format(offset + number), email=f'bench{offset + number}@example.com',
+                  password=password) for number in range(users)),
+            batch_size=BATCH_SIZE)
+        user_ids = list(User.objects.order_by('id').values_list('id', flat=True)[offset:])
+        record('user', user_ids)
+        rng.shuffle(user_ids)
+        weights = zipf_weights(len(user_ids))
+        log(f'{users} users')
+
+        group_objects = Group.objects.bulk_create(
+            Group(title=f'Generated group {number}', slug=f'generated-{offset}-{number}', description='Generated')
+            for number in range(groups))
+        record('group', [group.pk for group in group_objects])
+        group_ids = [group.pk for group in group_objects] or [None]
+        log(f'{groups} groups')
+
+        image_names = make_images(rng, min(IMAGE_POOL_SIZE, posts)) if image_ratio else []
+        record('image', image_names)
+        first_post = Post.objects.order_by('-id').values_list('id', flat=True).first() or 0
+        authors = rng.choices(user_ids, weights, k=posts)
+        Post.objects.bulk_create(
+            (Post(text=f'Generated post {number}. ' * rng.randint(1, 40),
+                  author_id=author,
+                  group_id=rng.choice(group_ids) if rng.random() < 0.6 else None,
+                  image=rng.choice(image_names) if image_names and rng.random() < image_ratio else None)
+             for number, author in enumerate(authors)),
+            batch_size=BATCH_SIZE)
+        post_ids = list(Post.objects.filter(id__gt=first_post).order_by('id').values_list('id', flat=True))
+        # auto_now_add stamps every row with the same time; spread them over ``days``.
+        dates = sorted(now - timedelta(seconds=rng.randrange(days * 24 * 3600)) for _ in post_ids)
+        for start in range(0, len(post_ids), BATCH_SIZE):
+            Post.objects.bulk_update(
+                [Post(pk=pk, pub_date=date) for pk, date in
+                 zip(post_ids[start:start + BATCH_SIZE], dates[start:start + BATCH_SIZE])],
+                ['pub_date'])
+        log(f'{posts} posts')
+
+        post_weights = zipf_weights(len(post_ids), exponent=0.9)
+        commented = list(reversed(post_ids))
+        Comment.objects.bulk_create(
+            (Comment(post_id=post_id, author_id=rng.choice(user_ids), text=f'Generated comment {number}')
+             for number, post_id in enumerate(rng.choices(commented, post_weights, k=comments))),
+            batch_size=BATCH_SIZE)
+        log(f'{comments} comments')
+
+        pairs = set()
+        attempts = 0
+        while len(pairs) < follows and attempts < follows * 10:
+            attempts += 1
+            follower, author = rng.choice(user_ids), rng.choices(user_ids, weights)[0]
+            if follower != author:
+                pairs.add((follower, author))
+        Follow.objects.bulk_create((Follow(user_id=user, author_id=author) for user, author in sorted(pairs)),
+                                   batch_size=BATCH_SIZE, ignore_conflicts=True)
+        log(f'{len(pairs)} follows')
+
+        rebuild_counters()
+        rebuild_feeds()
+        rebuild_index()
+        touch_all()
+        log('counters, feeds and search index rebuilt')
+    return user_ids
+
+
+def generated_ids(kind):
+    recorded = GeneratedObject.objects.filter(kind=kind)
+    return recorded.annotate(object_id=Cast('key', BigIntegerField())).values('object_id')
+
+
+def clear_generated():
+    """Delete what ``generate`` recorded, and the generated users' posts, comments and follows."""
+    with transaction.atomic():
+        User.objects.filter(pk__in=generated_ids('user')).delete()
+        Group.objects.filter(pk__in=generated_ids('group')).delete()
+        names = list(GeneratedObject.objects.filter(kind='image').values_list('key', flat=True))
+        GeneratedObject.objects.all().delete()
+    for name in names:
+        default_storage.delete(name)
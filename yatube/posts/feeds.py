@@ -0,0 +1,116 @@
+from django.apps import apps as global_apps
+from django.conf import settings
+from django.db import connection
+from django.db.models import Q
+
+from .models import AuthorStats, FeedEntry, Follow, Post
+
+FANOUT_BATCH_SIZE = 1000
+
+
+def is_celebrity(author_id):
+    return AuthorStats.objects.filter(user_id=author_id, followers_count__gt=settings.FEED_FANOUT_LIMIT).exists()
+
+
+def celebrity_ids(user):
+    """Followed authors whose posts are merged in at read time."""
+    return list(Follow.objects.filter(user=user, author__stats__followers_count__gt=settings.FEED_FANOUT_LIMIT)
+                .values_list('author_id', flat=True))
+
+
+def fan_out(post):
+    """Push a new post into the timeline of every follower of its author."""
+    if is_celebrity(post.author_id):
+        return
+    followers = Follow.objects.filter(author_id=post.author_id).values_list('user_id', flat=True)
+    FeedEntry.objects.bulk_create(
+        [FeedEntry(user_id=user_id, post_id=post.pk, pub_date=post.pub_date) for user_id in followers],
+        batch_size=FANOUT_BATCH_SIZE,
+        ignore_conflicts=True,
+    )
+
+
+def backfill(user_id, author_id):
+    if is_celebrity(author_id):
+        return
+    recent = (Post.objects.filter(author_id=author_id)
+              .order_by('-pub_date', '-id')
+              .values_list('id', 'pub_date')[:settings.FEED_BACKFILL_LIMIT])
+    FeedEntry.objects.bulk_create(
+        [FeedEntry(user_id=user_id, post_id=post_id, pub_date=pub_date) for post_id, pub_date in recent],
+        batch_size=FANOUT_BATCH_SIZE,
+        ignore_conflicts=True,
+    )
+
+
+def at_fanout_limit(author_id):
+    return AuthorStats.objects.filter(user_id=author_id, followers_count=settings.FEED_FANOUT_LIMIT).exists()
+
+
+def backfill_followers(author_id):
+    """
+    Give every follower entries for the author's recent posts, once the
+    author is back down to FEED_FANOUT_LIMIT followers: the posts written
+    above it have no entries, they were merged in at read time. Returns the
+    follower ids.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(f"""
+            INSERT INTO {FeedEntry._meta.db_table} (user_id, post_id, pub_date)
+            SELECT follow.user_id, recent.id, recent.pub_date
+            FROM {Follow._meta.db_table} follow
+            JOIN (
+                SELECT id, pub_date FROM {Post._meta.db_table}
+                WHERE author_id = %s ORDER BY pub_date DESC, id DESC LIMIT %s
+            ) recent
+            WHERE follow.author_id = %s
+            ON CONFLICT DO NOTHING
+        """, [author_id, settings.FEED_BACKFILL_LIMIT, author_id])
+    return list(Follow.objects.filter(author_id=author_id).values_list('user_id', flat=True))
+
+
+def prune(user_id, author_id):
+    FeedEntry.objects.filter(user_id=user_id, post__author_id=author_id).delete()
+
+
+def follow_feed(user):
+    """
+    Return ``(queryset, ordering, transform)`` for the followed-authors feed.
+
+    Normally this is a single range scan over the user's FeedEntry rows.
+    When the user follows authors that are too popular to fan out on write,
+    their posts are merged in from the Post table at read time.
+    """
+    celebrities = celebrity_ids(user)
+    if not celebrities:
+        entries = FeedEntry.objects.filter(user=user).select_related('post__author', 'post__group')
+        return entries, ('-pub_date', '-post_id'), lambda rows: [entry.post for entry in rows]
+
+    posts = (Post.objects
+             .filter(Q(id__in=FeedEntry.objects.filter(user=user).values('post_id'))
+                     | Q(author_id__in=celebrities))
+             .select_related('author', 'group'))
+    return posts, ('-pub_date', '-id'), None
+
+
+def rebuild_feeds(apps=global_apps):
+    """Recreate every timeline from the follow graph in one set-based statement."""
+    Follow = apps.get_model('posts', 'Follow')
+    FeedEntry = apps.get_model('posts', 'FeedEntry')
+    Post = apps.get_model('posts', 'Post')
+    AuthorStats = apps.get_model('posts', 'AuthorStats')
+
+    FeedEntry.objects.all().delete()
+    with connection.cursor() as cursor:
+        cursor.execute(f"""
+            INSERT INTO {FeedEntry._meta.db_table} (user_id, post_id, pub_date)
+            SELECT follow.user_id, recent.id, recent.pub_date
+            FROM {Follow._meta.db_table} follow
+            LEFT JOIN {AuthorStats._meta.db_table} stats ON stats.user_id = follow.author_id
+            JOIN (
+                SELECT id, author_id, pub_date,
+                       ROW_NUMBER() OVER (PARTITION BY author_id ORDER BY pub_date DESC, id DESC) AS position
+                FROM {Post._meta.db_table}
+            ) recent ON recent.author_id = follow.author_id AND recent.position <= %s
+            WHERE COALESCE(stats.followers_count, 0) <= %s
+        """, [settings.FEED_BACKFILL_LIMIT, settings.FEED_FANOUT_LIMIT])
@@ -0,0 +1,167 @@
+"""
+Conditional GETs and edge caching for the public feed pages.
+
+Every public scope (the global feed, a group, an author) that has changed
+has a row in FeedFreshness with the time anything shown under it last
+changed; the cache invalidation path writes it and the value is mirrored in
+the cache. Reads never create rows, and only add missing times to the
+cache, so they cannot overwrite a newer time written meanwhile.
+Anonymous requests get an ETag and Last-Modified from those times, so a
+revalidation is answered before the view runs, and Cache-Control and
+Surrogate-Key headers that let the edge keep the page and purge it by
+group or author.
+"""
+import asyncio
+import hashlib
+from datetime import datetime
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
+
+from .models import FeedFreshness
+
+MODIFIED_KEY = 'feed_modified:{}'
+EXISTS_KEY = 'feed_exists:{}'
+PUBLIC_SCOPES = ('global', 'group:', 'author:')
+# The time of the last bulk load, which touch_all records; every page is at
+# least as new, and scopes without a row have not changed since.
+BASELINE_SCOPE = 'baseline'
+EPOCH = datetime(2000, 1, 1, tzinfo=timezone.utc)
+
+
+def is_public(scope):
+    return scope.startswith(PUBLIC_SCOPES)
+
+
+def modified_key(scope):
+    return MODIFIED_KEY.format(hashlib.md5(scope.encode()).hexdigest())
+
+
+def touch(scopes):
+    """Record that the public ``scopes`` changed now."""
+    scopes = sorted({scope for scope in scopes if is_public(scope)})
+    if not scopes:
+        return
+    now = timezone.now()
+    if FeedFreshness.objects.filter(scope__in=scopes).update(modified=now) < len(scopes):
+        FeedFreshness.objects.bulk_create([FeedFreshness(scope=scope, modified=now) for scope in scopes],
+                                          ignore_conflicts=True)
+    # Readers must not see the new time before the rows it stands for.
+    transaction.on_commit(lambda: cache.set_many({modified_key(scope): now for scope in scopes}, None))
+
+
+def touch_all():
+    """After bulk loads, which bypass the signals: every page may have changed."""
+    now = timezone.now()
+    FeedFreshness.objects.update(modified=now)
+    FeedFreshness.objects.get_or_create(scope=BASELINE_SCOPE, defaults={'modified': now})
+    transaction.on_commit(lambda: cache.set(modified_key(BASELINE_SCOPE), now, None))
+
+
+def last_modified(scopes):
+    scopes = [*scopes, BASELINE_SCOPE]
+    keys = {modified_key(scope): scope for scope in scopes}
+    times = {keys[key]: value for key, value in cache.get_many(keys).items()}
+    missing = [scope for scope in scopes if scope not in times]
+    if missing:
+        found = dict(FeedFreshness.objects.filter(scope__in=missing).values_list('scope', 'modified'))
+        # Scopes without a row are cached too, as never changed; touch() replaces them.
+        found = {scope: found.get(scope, EPOCH) for scope in missing}
+        for scope, value in found.items():
+            # A touch() that committed after the query above has already cached a newer time.
+            if not cache.add(modified_key(scope), value, None):
+                value = cache.get(modified_key(scope), value)
+            times[scope] = value
+    return max(times.values())
+
+
+def validators(request, scopes):
+    """``(scope names, Last-Modified, ETag)`` for an anonymous GET, else None."""
+    if request.method not in ('GET', 'HEAD') or request.user.is_authenticated:
+        return None
+    modified = last_modified(scopes)
+    etag = hashlib.md5(f'{request.get_full_path()}|{modified.isoformat()}'.encode()).hexdigest()
+    return scopes, modified, quote_etag(etag)
+
+
+def exists_key(request):
+    return EXISTS_KEY.format(hashlib.md5(request.path.encode()).hexdigest())
+
+
+def confirm_exists(request, checked):
+    """A 200 shows the page's object was there as of the scopes' time."""
+    cache.set(exists_key(request), checked[1], settings.FEED_CACHE_TIMEOUT)
+
+
+def still_exists(request, modified, exists, args, kwargs):
+    """Whether the page's object exists; looked up at most once per change of its scopes."""
+    if cache.get(exists_key(request)) == modified:
+        return True
+    if not exists(request, *args, **kwargs):
+        return False
+    cache.set(exists_key(request), modified, settings.FEED_CACHE_TIMEOUT)
+    return True
+
+
+def add_headers(request, response, checked):
+    if checked is None:
+        # request.user is only loaded for GETs, and must not be loaded here in async views.
+        if request.method in ('GET', 'HEAD') and request.user.is_authenticated:
+            patch_cache_control(response, private=True)
+        return response
+    scopes, modified, etag = checked
+    if response.status_code in (200, 304):
+        response.headers.setdefault('ETag', etag)
+        response.headers.setdefault('Last-Modified', http_date(modified.timestamp()))
+        patch_cache_control(response, public=True, max_age=0, s_maxage=settings.EDGE_CACHE_SECONDS,
+                            stale_while_revalidate=settings.EDGE_STALE_SECONDS)
+        response['Surrogate-Key'] = ' '.join(scopes)
+    return response
+
+
+def conditional(scopes, exists=None):
+    """
+    Answer If-None-Match / If-Modified-Since from anonymous visitors with the
+    last-modified times of the view's scopes, without running the view.
+    ``exists(request, *args, **kwargs)`` tells whether the object the page
+    shows is still there; if not, the view runs and answers 404.
+    """
+    def decorator(view):
+        def check(request, *args, **kwargs):
+            checked = validators(request, scopes(request, *args, **kwargs))
+            if checked is None:
+                return None, None
+            _, modified, etag = checked
+            response = get_conditional_response(request, etag=etag, last_modified=int(modified.timestamp()))
+            if response is not None and exists is not None and not still_exists(request, modified, exists,
+                                                                                args, kwargs):
+                response = None
+            return checked, response
+
+        if asyncio.iscoroutinefunction(view):
+            @wraps(view)
+            async def async_wrapper(request, *args, **kwargs):
+                checked, response = await sync_to_async(check)(request, *args, **kwargs)
+                if response is None:
+                    response = await view(request, *args, **kwargs)
+                    if exists is not None and checked is not None and response.status_code == 200:
+                        await sync_to_async(confirm_exists)(request, checked)
+                return add_headers(request, response, checked)
+            return async_wrapper
+
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            checked, response = check(request, *args, **kwargs)
+            if response is None:
+                response = view(request, *args, **kwargs)
+                if exists is not None and checked is not None and response.status_code == 200:
+                    confirm_exists(request, checked)
+            return add_headers(request, response, checked)
+        return wrapper
+    return decorator
@@ -0,0 +1,66 @@
+"""
+Responsive image variants for post cards.
+
+Only Pillow and the standard library are used here so that the functions
+can run in worker processes that never set up Django.
+"""
+import os
+
+from PIL import Image, ImageOps, features
+
+CARD_WIDTH, CARD_HEIGHT = 960, 339
+VARIANT_WIDTHS = (480, 960, 1440)
+VARIANTS_DIR = 'posts/variants'
+
+FORMATS = [('avif', 'AVIF', 'image/avif'), ('webp', 'WEBP', 'image/webp'), ('jpg', 'JPEG', 'image/jpeg')]
+SAVE_OPTIONS = {
+    'AVIF': {'quality': 60},
+    'WEBP': {'quality': 78, 'method': 4},
+    'JPEG': {'quality': 82, 'optimize': True, 'progressive': True},
+}
+
+
+def supported_formats():
+    formats = []
+    for extension, pillow_format, mime in FORMATS:
+        if pillow_format == 'JPEG' or features.check(pillow_format.lower()):
+            formats.append((extension, pillow_format, mime))
+    return formats
+
+
+def variant_name(name, width, extension):
+    stem = os.path.splitext(os.path.basename(name))[0]
+    return f'{VARIANTS_DIR}/{stem}-{width}.{extension}'
+
+
+def build_variants(media_root, name):
+    """
+    Write card-ratio crops of ``name`` in every width and format and return
+    their metadata. Files that already exist are kept, so re-running over
+    the same image only fills in what is missing.
+    """
+    with Image.open(os.path.join(media_root, name)) as original:
+        original = ImageOps.exif_transpose(original)
+        source_width, source_height = original.size
+        crop_width = min(source_width, round(source_height * CARD_WIDTH / CARD_HEIGHT))
+        card = ImageOps.fit(original.convert('RGB'), (crop_width, round(crop_width * CARD_HEIGHT / CARD_WIDTH)))
+
+    os.makedirs(os.path.join(media_root, VARIANTS_DIR), exist_ok=True)
+    widths = [width for width in VARIANT_WIDTHS if width <= max(card.width, VARIANT_WIDTHS[0])]
+    sources = {}
+    for extension, pillow_format, mime in supported_formats():
+        sources[mime] = []
+        for width in widths:
+            height = round(width * CARD_HEIGHT / CARD_WIDTH)
+            target = variant_name(name, width, extension)
+            path = os.path.join(media_root, target)
+            if not os.path.exists(path):
+                card.resize((width, height), Image.LANCZOS).save(path + '.part', pillow_format,
+                                                                  **SAVE_OPTIONS[pillow_format])
+                os.replace(path + '.part', path)
+            sources[mime].append({'name': target, 'width': width, 'height': height})
+    return {
+        'source': name,
+        'original': {'width': source_width, 'height': source_height},
+        'sources': sources,
+    }
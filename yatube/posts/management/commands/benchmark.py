@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from posts.benchmark import SCENARIOS, TRANSPORTS, dumps, run
+
+
+class Command(BaseCommand):
+    help = 'Load-test the main views and print a JSON report'
+
+    def add_arguments(self, parser):
+        parser.add_argument('scenarios', nargs='*', metavar='scenario',
+                            help=f'Views to drive, any of {", ".join(SCENARIOS)} (all by default)')
+        parser.add_argument('--requests', type=int, default=100, help='Requests per scenario')
+        parser.add_argument('--concurrency', type=int, default=4, help='Concurrent sessions')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--transport', choices=TRANSPORTS, default='client',
+                            help='Test client, HTTP to a local WSGI server, or concurrent coroutines through the '
+                                 'ASGI handler (run with YATUBE_ASYNC_VIEWS=1 to compare the async views)')
+        parser.add_argument('--output', help='Also write the report to this file')
+
+    def handle(self, *args, **options):
+        unknown = set(options['scenarios']) - set(SCENARIOS)
+        if unknown:
+            raise CommandError(f'Unknown scenarios: {", ".join(sorted(unknown))}')
+        try:
+            report = run(options['scenarios'] or SCENARIOS, requests=options['requests'],
+                         concurrency=options['concurrency'], seed=options['seed'], transport=options['transport'])
+        except ValueError as error:
+            raise CommandError(error)
+        output = dumps(report)
+        if options['output']:
+            with open(options['output'], 'w') as file:
+                file.write(output + '\n')
+        self.stdout.write(output)
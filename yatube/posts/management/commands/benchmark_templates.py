@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from posts.benchmark import TEMPLATE_ENGINES, dumps, run_render
+
+
+class Command(BaseCommand):
+    help = 'Time rendering a 10-post feed page with the Django and Jinja2 engines and print a JSON report'
+
+    def add_arguments(self, parser):
+        parser.add_argument('engines', nargs='*', metavar='engine',
+                            help=f'Engines to compare, any of {", ".join(TEMPLATE_ENGINES)} (all by default)')
+        parser.add_argument('--renders', type=int, default=200, help='Renders per engine and case')
+        parser.add_argument('--posts', type=int, default=10, help='Posts on the page')
+        parser.add_argument('--output', help='Also write the report to this file')
+
+    def handle(self, *args, **options):
+        unknown = set(options['engines']) - set(TEMPLATE_ENGINES)
+        if unknown:
+            raise CommandError(f'Unknown engines: {", ".join(sorted(unknown))}')
+        report = run_render(options['engines'] or TEMPLATE_ENGINES, renders=options['renders'],
+                            size=options['posts'])
+        output = dumps(report)
+        if options['output']:
+            with open(options['output'], 'w') as file:
+                file.write(output + '\n')
+        self.stdout.write(output)
@@ -0,0 +1,23 @@
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+
+from yatube.assets import build
+
+
+class Command(BaseCommand):
+    help = 'Compile the CSS and JS bundles into assets/build'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--collect', action='store_true',
+                            help='Run collectstatic afterwards (hashed, precompressed with YATUBE_STATIC_MANIFEST=1)')
+
+    def handle(self, *args, **options):
+        try:
+            sizes = build()
+        except ImproperlyConfigured as error:
+            raise CommandError(error)
+        for name, size in sizes.items():
+            self.stdout.write(f'{name}: {size} bytes')
+        if options['collect']:
+            call_command('collectstatic', interactive=False, verbosity=options['verbosity'])
@@ -0,0 +1,36 @@
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from posts import images
+from posts.models import Post
+from posts.thumbnails import store_variants
+
+
+class Command(BaseCommand):
+    help = 'Build responsive image variants for every post image; safe to re-run'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=os.cpu_count(),
+                            help='Number of worker processes (defaults to the number of cores)')
+
+    def handle(self, *args, **options):
+        posts = {post.image.name: post
+                 for post in Post.objects.exclude(image='').exclude(image__isnull=True).select_related('author', 'group')}
+        build_in_worker = partial(images.build_variants, settings.MEDIA_ROOT)
+        done = failed = 0
+        context = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(max_workers=options['workers'], mp_context=context) as pool:
+            futures = {pool.submit(build_in_worker, name): name for name in posts}
+            for future, name in futures.items():
+                try:
+                    store_variants(posts[name], future.result())
+                    done += 1
+                except Exception as error:
+                    failed += 1
+                    self.stderr.write(f'{name}: {error}')
+        self.stdout.write(self.style.SUCCESS(f'Built variants for {done} images, {failed} failed'))
@@ -0,0 +1,29 @@
+import sys
+
+from django.core.management.base import BaseCommand
+
+from posts.transfer import BATCH_SIZE, CSVWriter, NDJSONWriter, export_content
+
+
+class Command(BaseCommand):
+    help = 'Stream users, groups, posts, comments and follows to NDJSON or a directory of CSV files'
+
+    def add_arguments(self, parser):
+        parser.add_argument('output', help='NDJSON file, "-" for stdout, or a directory with --format csv')
+        parser.add_argument('--format', choices=('ndjson', 'csv'), default='ndjson')
+        parser.add_argument('--media', help='Copy post images into this directory')
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        if options['format'] == 'csv':
+            writer = CSVWriter(options['output'])
+        elif options['output'] == '-':
+            writer = NDJSONWriter(sys.stdout)
+        else:
+            writer = NDJSONWriter(open(options['output'], 'w', encoding='utf-8'))
+        try:
+            count = export_content(writer, media=options['media'], batch_size=options['batch_size'])
+        finally:
+            if options['format'] == 'ndjson' and options['output'] != '-':
+                writer.stream.close()
+        self.stderr.write(self.style.SUCCESS(f'Exported {count} records'))
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+
+from posts.datagen import clear_generated, generate
+
+
+class Command(BaseCommand):
+    help = 'Generate a reproducible synthetic dataset for load tests and benchmarks'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--posts', type=int, default=10000)
+        parser.add_argument('--groups', type=int, default=20)
+        parser.add_argument('--comments', type=int, default=30000)
+        parser.add_argument('--follows', type=int, default=10000)
+        parser.add_argument('--image-ratio', type=float, default=0.1,
+                            help='Share of posts that get an image')
+        parser.add_argument('--days', type=int, default=365, help='Spread publication dates over this many days')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--clear', action='store_true', help='Delete previously generated data first')
+
+    def handle(self, *args, **options):
+        if options['clear']:
+            clear_generated()
+        generate(users=options['users'], posts=options['posts'], groups=options['groups'],
+                 comments=options['comments'], follows=options['follows'], image_ratio=options['image_ratio'],
+                 days=options['days'], seed=options['seed'], stdout=self.stdout)
+        self.stdout.write(self.style.SUCCESS('Dataset generated'))
@@ -0,0 +1,36 @@
+import os
+import sys
+
+from django.core.management.base import BaseCommand
+
+from posts.transfer import BATCH_SIZE, import_content, read_csv, read_ndjson
+
+
+class Command(BaseCommand):
+    help = ('Load an export_content dump in chunks, then rebuild counters, feeds and the search index; '
+            'rerun after an interruption to resume')
+
+    def add_arguments(self, parser):
+        parser.add_argument('input', help='NDJSON file, "-" for stdin, or a directory of CSV files')
+        parser.add_argument('--workers', type=int, default=0,
+                            help='Worker processes loading chunks in parallel (0 loads in this process)')
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+        parser.add_argument('--state', help='Checkpoint file (defaults to INPUT.state; none for stdin)')
+        parser.add_argument('--media', help='Directory to copy post images from')
+
+    def handle(self, *args, **options):
+        source = options['input']
+        state = options['state'] or (None if source == '-' else f'{source.rstrip(os.sep)}.state')
+        if os.path.isdir(source):
+            records = read_csv(source)
+            stream = None
+        else:
+            stream = sys.stdin if source == '-' else open(source, encoding='utf-8')
+            records = read_ndjson(stream)
+        try:
+            count = import_content(records, batch_size=options['batch_size'], workers=options['workers'],
+                                   state=state, media=options['media'], stdout=self.stdout)
+        finally:
+            if stream not in (None, sys.stdin):
+                stream.close()
+        self.stdout.write(self.style.SUCCESS(f'Imported {count} records'))
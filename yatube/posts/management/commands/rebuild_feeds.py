@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from posts.feeds import rebuild_feeds
+
+
+class Command(BaseCommand):
+    help = 'Recreate the materialized follow timelines from the follow graph'
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            rebuild_feeds()
+        self.stdout.write(self.style.SUCCESS('Feeds rebuilt'))
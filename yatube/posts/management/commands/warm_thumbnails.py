@@ -0,0 +1,43 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+from sorl.thumbnail import get_thumbnail
+
+from posts.cache import invalidate, invalidate_cards, post_scopes
+from posts.models import Post
+from posts.thumbnails import CARD_GEOMETRY, CARD_OPTIONS
+
+
+def warm(name):
+    try:
+        get_thumbnail(name, CARD_GEOMETRY, **CARD_OPTIONS)
+        return None
+    except Exception as error:
+        return f'{name}: {error}'
+    finally:
+        connections.close_all()
+
+
+class Command(BaseCommand):
+    help = 'Generate card thumbnails for existing posts in parallel'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=os.cpu_count(),
+                            help='Number of worker processes (defaults to the number of cores)')
+
+    def handle(self, *args, **options):
+        posts = list(Post.objects.exclude(image='').exclude(image__isnull=True).select_related('author', 'group'))
+        # Forked workers must not share the parent's database connection.
+        connections.close_all()
+        failed = 0
+        with ProcessPoolExecutor(max_workers=options['workers']) as pool:
+            for error in pool.map(warm, (post.image.name for post in posts), chunksize=16):
+                if error:
+                    failed += 1
+                    self.stderr.write(error)
+        invalidate_cards(posts)
+        for post in posts:
+            invalidate(*post_scopes(post))
+        self.stdout.write(self.style.SUCCESS(f'Warmed {len(posts) - failed} thumbnails, {failed} failed'))
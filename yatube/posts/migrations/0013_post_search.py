@@ -0,0 +1,40 @@
+# Generated by Django 4.0.7 on 2026-10-18 18:25
+
+from django.db import migrations, models
+import django.db.models.deletion
+import posts.models
+
+
+def create_index(apps, schema_editor):
+    from posts.search import get_backend, rebuild_index
+    with schema_editor.connection.cursor() as cursor:
+        get_backend(schema_editor.connection).install(cursor)
+    rebuild_index(schema_editor.connection)
+
+
+def drop_index(apps, schema_editor):
+    from posts.search import get_backend
+    with schema_editor.connection.cursor() as cursor:
+        get_backend(schema_editor.connection).uninstall(cursor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0012_feed_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchDocument',
+            fields=[
+                ('post', models.OneToOneField(db_column='rowid', on_delete=django.db.models.deletion.DO_NOTHING, primary_key=True, related_name='search_document', serialize=False, to='posts.post')),
+                ('document', posts.models.SearchDocumentField()),
+            ],
+            options={
+                'db_table': 'posts_post_search',
+                'managed': False,
+            },
+        ),
+        migrations.RunPython(create_index, drop_index),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 4.0.7 on 2026-10-18 18:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0013_post_search'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='authorstats',
+            index=models.Index(fields=['-posts_count', '-user'], name='author_activity'),
+        ),
+        migrations.AddIndex(
+            model_name='authorstats',
+            index=models.Index(fields=['-followers_count', '-user'], name='author_followers'),
+        ),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 4.0.7 on 2026-10-18 18:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0014_author_directory_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FeedFreshness',
+            fields=[
+                ('scope', models.CharField(max_length=200, primary_key=True, serialize=False)),
+                ('modified', models.DateTimeField()),
+            ],
+        ),
+    ]
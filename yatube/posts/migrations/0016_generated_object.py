@@ -0,0 +1,25 @@
+# Generated by Django 4.0.7 on 2026-10-18 20:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0015_feed_freshness'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GeneratedObject',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(max_length=20)),
+                ('key', models.CharField(max_length=255)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='generatedobject',
+            index=models.Index(fields=['kind'], name='generated_kind'),
+        ),
+    ]
@@ -1,6 +1,6 @@
 from django.db import models
 from django.contrib.auth import get_user_model
-from django.db.models import Q, F
+from django.db.models import Q, F, Lookup
 
 User = get_user_model()
 
@@ -20,6 +20,15 @@ class Post(models.Model):
     author = models.ForeignKey(User, on_delete=models.CASCADE, related_name="posts")
     group = models.ForeignKey(Group, on_delete=models.SET_NULL, related_name="posts", blank=True, null=True)
     image = models.ImageField(upload_to='posts/', blank=True, null=True)
+    comment_count = models.PositiveIntegerField(default=0, editable=False)
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['-pub_date', '-id'], name='post_feed'),
+            models.Index(fields=['group', '-pub_date', '-id'], name='post_group_feed'),
+            models.Index(fields=['author', '-pub_date', '-id'], name='post_author_feed'),
+        ]
 
 
 class Comment(models.Model):
@@ -28,6 +37,11 @@ class Comment(models.Model):
     text = models.TextField()
     date_created = models.DateTimeField(verbose_name="date created", auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['post', 'date_created', 'id'], name='comment_thread'),
+        ]
+
 
 class Follow(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="follower")
@@ -43,4 +57,104 @@ class Follow(models.Model):
                 check=~Q(user=F('author')),
                 name='user_not_author'
             )
-        ]
\ No newline at end of file
+        ]
+        indexes = [
+            models.Index(fields=['author', 'user'], name='follow_followers'),
+        ]
+
+
+class AuthorStats(models.Model):
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name="stats")
+    posts_count = models.PositiveIntegerField(default=0)
+    followers_count = models.PositiveIntegerField(default=0)
+    following_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['-posts_count', '-user'], name='author_activity'),
+            models.Index(fields=['-followers_count', '-user'], name='author_followers'),
+        ]
+
+    @classmethod
+    def for_user(cls, user):
+        try:
+            return user.stats
+        except cls.DoesNotExist:
+            return cls.objects.get_or_create(user=user)[0]
+
+
+
+class FeedEntry(models.Model):
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="feed_entries")
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name="feed_entries")
+    pub_date = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'post'],
+                name='unique_user_post_feed_entry'
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['user', '-pub_date', '-post'], name='feed_entry_timeline'),
+        ]
+
+
+class FeedFreshness(models.Model):
+    """When anything shown under a public feed scope last changed."""
+    scope = models.CharField(max_length=200, primary_key=True)
+    modified = models.DateTimeField()
+
+
+class GeneratedObject(models.Model):
+    """A user, group or upload created by posts.datagen; clear_generated deletes only these."""
+    kind = models.CharField(max_length=20)
+    key = models.CharField(max_length=255)
+
+    class Meta:
+        indexes = [models.Index(fields=['kind'], name='generated_kind')]
+
+
+class ImportedPost(models.Model):
+    """The post an exported post id became in one run of posts.transfer.import_content."""
+    run = models.CharField(max_length=32)
+    source_id = models.BigIntegerField()
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name="+")
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['run', 'source_id'], name='unique_run_source_imported_post'),
+        ]
+
+
+class SearchDocumentField(models.TextField):
+    """FTS5 column on SQLite, ``tsvector`` on PostgreSQL."""
+
+
+@SearchDocumentField.register_lookup
+class Match(Lookup):
+    lookup_name = 'match'
+
+    def as_sqlite(self, compiler, connection):
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+        rhs, rhs_params = self.process_rhs(compiler, connection)
+        return f'{lhs} MATCH {rhs}', lhs_params + rhs_params
+
+    def as_postgresql(self, compiler, connection):
+        from .search import POSTGRES_CONFIG
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+        rhs, rhs_params = self.process_rhs(compiler, connection)
+        return f'{lhs} @@ websearch_to_tsquery(%s, {rhs})', lhs_params + [POSTGRES_CONFIG] + rhs_params
+
+
+class SearchDocument(models.Model):
+    """A row of the full-text index; the table is created per database in posts/search.py."""
+    post = models.OneToOneField(Post, on_delete=models.DO_NOTHING, primary_key=True, db_column='rowid',
+                                related_name='search_document')
+    document = SearchDocumentField()
+
+    class Meta:
+        managed = False
+        db_table = 'posts_post_search'
+
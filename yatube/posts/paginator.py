@@ -0,0 +1,214 @@
+import base64
+import binascii
+import hashlib
+import json
+import math
+
+from django.core.cache import cache
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Q
+from django.utils.functional import cached_property
+
+
+NEXT = 'n'
+PREVIOUS = 'p'
+
+
+class InvalidCursor(Exception):
+    pass
+
+
+class CursorPage:
+    def __init__(self, object_list, paginator, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.paginator = paginator
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __repr__(self):
+        return f'<CursorPage of {len(self.object_list)} items>'
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+class CursorPaginator:
+    """
+    Keyset paginator: every page is a single range query on the ordering
+    columns limited to ``per_page + 1`` rows, so the cost of a page does not
+    depend on how deep it is or how big the table is.
+
+    ``ordering`` must end with a unique column (``id``) to break ties.
+    ``count`` is optional and may be a number or a callable; it is only
+    evaluated when something asks for ``paginator.count``.
+    """
+
+    def __init__(self, queryset, per_page, ordering=('-pub_date', '-id'), count=None, transform=None):
+        self.queryset = queryset
+        self.per_page = per_page
+        self.ordering = tuple(ordering)
+        self.fields = [name.lstrip('-') for name in self.ordering]
+        self.descending = [name.startswith('-') for name in self.ordering]
+        self._count = count
+        self.transform = transform
+
+    @cached_property
+    def count(self):
+        if callable(self._count):
+            return self._count()
+        return self._count
+
+    def encode_cursor(self, obj, direction):
+        values = [self._serialize(getattr(obj, name)) for name in self.fields]
+        data = json.dumps([direction, values], separators=(',', ':'))
+        return base64.urlsafe_b64encode(data.encode()).decode().rstrip('=')
+
+    @staticmethod
+    def _serialize(value):
+        if hasattr(value, 'isoformat'):
+            return value.isoformat()
+        return value
+
+    def decode_cursor(self, token):
+        try:
+            padded = token + '=' * (-len(token) % 4)
+            direction, values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        except (ValueError, TypeError, binascii.Error):
+            raise InvalidCursor(token)
+        if direction not in (NEXT, PREVIOUS) or not isinstance(values, list) or len(values) != len(self.fields):
+            raise InvalidCursor(token)
+        if not all(isinstance(value, (str, int, float)) for value in values):
+            raise InvalidCursor(token)
+        try:
+            values = [self._deserialize(name, value) for name, value in zip(self.fields, values)]
+        except (ValidationError, TypeError, ValueError, OverflowError):
+            raise InvalidCursor(token)
+        if not all(self._storable(value) for value in values):
+            raise InvalidCursor(token)
+        return direction, values
+
+    @staticmethod
+    def _storable(value):
+        """Numbers the database can compare against: 64-bit integers and finite floats."""
+        if isinstance(value, int):
+            return -2 ** 63 <= value < 2 ** 63
+        if isinstance(value, float):
+            return math.isfinite(value)
+        return True
+
+    def _deserialize(self, name, value):
+        try:
+            field = self.queryset.model._meta.get_field(name)
+        except FieldDoesNotExist:
+            # Annotations such as a search rank are plain JSON numbers.
+            if not isinstance(value, (int, float)):
+                raise ValidationError(f'Invalid value for {name}')
+            return value
+        return field.to_python(value)
+
+    def _seek(self, values, forward):
+        condition = Q()
+        for position, name in enumerate(self.fields):
+            after = self.descending[position] == forward
+            term = Q(**{f'{name}__{"lt" if after else "gt"}': values[position]})
+            for previous, value in zip(self.fields[:position], values):
+                term &= Q(**{previous: value})
+            condition |= term
+        return condition
+
+    def _reversed_ordering(self):
+        return [name.lstrip('-') if name.startswith('-') else f'-{name}' for name in self.ordering]
+
+    def page(self, cursor=None):
+        direction, values = self.decode_cursor(cursor) if cursor else (NEXT, None)
+        queryset = self.queryset
+        if direction == NEXT:
+            if values is not None:
+                queryset = queryset.filter(self._seek(values, forward=True))
+            rows = list(queryset.order_by(*self.ordering)[:self.per_page + 1])
+            has_more = len(rows) > self.per_page
+            rows = rows[:self.per_page]
+            has_next, has_previous = has_more, values is not None
+        else:
+            queryset = queryset.filter(self._seek(values, forward=False))
+            rows = list(queryset.order_by(*self._reversed_ordering())[:self.per_page + 1])
+            has_more = len(rows) > self.per_page
+            rows = rows[:self.per_page][::-1]
+            has_next, has_previous = True, has_more
+
+        next_cursor = self.encode_cursor(rows[-1], NEXT) if rows and has_next else None
+        previous_cursor = self.encode_cursor(rows[0], PREVIOUS) if rows and has_previous else None
+        object_list = self.transform(rows) if self.transform else rows
+        return CursorPage(object_list, self, next_cursor, previous_cursor)
+
+    def get_page(self, cursor=None):
+        try:
+            return self.page(cursor)
+        except InvalidCursor:
+            return self.page()
+
+
+def approximate_count(key, queryset, timeout=300):
+    def count():
+        return cache.get_or_set(f'approximate_count:{key}', queryset.count, timeout)
+    return count
+
+
+def estimated_count(model, using='default'):
+    """
+    Row count of a whole table from the planner's statistics, or None when
+    there are none yet (SQLite fills them on ANALYZE).
+    """
+    table = model._meta.db_table
+    connection = connections[using]
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute('SELECT reltuples FROM pg_class WHERE relname = %s', [table])
+        elif connection.vendor == 'sqlite':
+            cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'sqlite_stat1'")
+            if cursor.fetchone() is None:
+                return None
+            cursor.execute('SELECT stat FROM sqlite_stat1 WHERE tbl = %s', [table])
+        else:
+            return None
+        row = cursor.fetchone()
+    if row is None:
+        return None
+    estimate = int(str(row[0]).split()[0]) if connection.vendor == 'sqlite' else int(row[0])
+    return estimate if estimate >= 0 else None
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Page-number paginator for the admin. An unfiltered table of more than
+    ``exact_limit`` rows is counted from the statistics; anything else gets
+    an exact count that is cached for a minute.
+    """
+    exact_limit = 10000
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if not queryset.query.where:
+            estimate = estimated_count(queryset.model, queryset.db)
+            if estimate is not None and estimate > self.exact_limit:
+                return estimate
+        key = hashlib.md5(str(queryset.query).encode()).hexdigest()
+        return approximate_count(f'{queryset.model._meta.label}:{key}', queryset, timeout=60)()
@@ -0,0 +1,155 @@
+"""
+Full-text search over posts.
+
+The index lives in ``posts_post_search``: an FTS5 table ranked with BM25
+on SQLite, a ``tsvector`` column with a GIN index ranked with
+``ts_rank_cd`` on PostgreSQL. Other databases fall back to LIKE scans.
+Rows are kept up to date by the Post signals; ``rebuild_index`` refills
+the table after bulk loads.
+"""
+import re
+
+from django.db import connection as default_connection
+from django.db.models import FloatField, Func, Value
+
+from .models import Post, SearchDocument
+
+TABLE = SearchDocument._meta.db_table
+POST_TABLE = Post._meta.db_table
+POSTGRES_CONFIG = 'russian'
+MAX_TERMS = 10
+
+
+def terms(query):
+    return re.findall(r'\w+', query.lower())[:MAX_TERMS]
+
+
+class Relevance(Func):
+    """Higher is better on every backend."""
+    output_field = FloatField()
+
+    def __init__(self, query):
+        super().__init__(Value(query))
+
+    def as_sql(self, compiler, connection):
+        return '0', []
+
+    def as_sqlite(self, compiler, connection):
+        # bm25() is lower for better matches.
+        return f'-bm25("{TABLE}")', []
+
+    def as_postgresql(self, compiler, connection):
+        query, params = compiler.compile(self.source_expressions[0])
+        return (f'ts_rank_cd("{TABLE}"."document", websearch_to_tsquery(%s, {query}))',
+                [POSTGRES_CONFIG, *params])
+
+
+class SearchBackend:
+    """LIKE fallback for databases without a full-text index."""
+
+    def install(self, cursor):
+        pass
+
+    def uninstall(self, cursor):
+        cursor.execute(f'DROP TABLE IF EXISTS {TABLE}')
+
+    def index(self, cursor, post_ids=None):
+        pass
+
+    def remove(self, cursor, post_ids):
+        pass
+
+    def prepare(self, query):
+        return query
+
+    def search(self, queryset, query):
+        for term in terms(query):
+            queryset = queryset.filter(text__icontains=term)
+        return queryset.annotate(rank=Value(0.0, output_field=FloatField()))
+
+
+class SQLiteSearch(SearchBackend):
+    def install(self, cursor):
+        cursor.execute(f"CREATE VIRTUAL TABLE {TABLE} USING fts5(document, tokenize='unicode61 remove_diacritics 2')")
+
+    def index(self, cursor, post_ids=None):
+        if post_ids is None:
+            cursor.execute(f'DELETE FROM {TABLE}')
+            where, params = '', []
+        else:
+            where, params = f' WHERE id IN ({", ".join(["%s"] * len(post_ids))})', list(post_ids)
+        cursor.execute(f'INSERT OR REPLACE INTO {TABLE} (rowid, document) SELECT id, text FROM {POST_TABLE}{where}',
+                       params)
+
+    def remove(self, cursor, post_ids):
+        cursor.execute(f'DELETE FROM {TABLE} WHERE rowid IN ({", ".join(["%s"] * len(post_ids))})', list(post_ids))
+
+    def prepare(self, query):
+        words = terms(query)
+        if not words:
+            return None
+        # Every word must match; the last one may still be being typed.
+        return ' '.join(f'"{word}"' for word in words) + '*'
+
+    def search(self, queryset, query):
+        match = self.prepare(query)
+        if match is None:
+            return queryset.annotate(rank=Value(0.0, output_field=FloatField())).none()
+        return queryset.filter(search_document__document__match=match).annotate(rank=Relevance(match))
+
+
+class PostgresSearch(SQLiteSearch):
+    def install(self, cursor):
+        cursor.execute(f'CREATE TABLE {TABLE} (rowid bigint PRIMARY KEY REFERENCES {POST_TABLE} (id) '
+                       f'ON DELETE CASCADE DEFERRABLE INITIALLY DEFERRED, document tsvector NOT NULL)')
+        cursor.execute(f'CREATE INDEX {TABLE}_document ON {TABLE} USING gin (document)')
+
+    def index(self, cursor, post_ids=None):
+        if post_ids is None:
+            cursor.execute(f'TRUNCATE {TABLE}')
+            where, params = '', []
+        else:
+            where, params = ' WHERE id = ANY(%s)', [list(post_ids)]
+        cursor.execute(f'INSERT INTO {TABLE} (rowid, document) '
+                       f'SELECT id, to_tsvector(%s, text) FROM {POST_TABLE}{where} '
+                       f'ON CONFLICT (rowid) DO UPDATE SET document = EXCLUDED.document',
+                       [POSTGRES_CONFIG, *params])
+
+    def remove(self, cursor, post_ids):
+        cursor.execute(f'DELETE FROM {TABLE} WHERE rowid = ANY(%s)', [list(post_ids)])
+
+    def prepare(self, query):
+        return query if terms(query) else None
+
+
+BACKENDS = {'sqlite': SQLiteSearch, 'postgresql': PostgresSearch}
+
+
+def get_backend(connection=default_connection):
+    return BACKENDS.get(connection.vendor, SearchBackend)()
+
+
+def index_posts(post_ids):
+    with default_connection.cursor() as cursor:
+        get_backend().index(cursor, post_ids)
+
+
+def remove_posts(post_ids):
+    with default_connection.cursor() as cursor:
+        get_backend().remove(cursor, post_ids)
+
+
+def rebuild_index(connection=default_connection):
+    """Refill the whole index from the posts table."""
+    with connection.cursor() as cursor:
+        get_backend(connection).index(cursor)
+
+
+def search_posts(query, group=None, author=None):
+    """Posts matching every word of ``query``, annotated with ``rank``."""
+    posts = Post.objects.select_related('author', 'group')
+    if group:
+        posts = posts.filter(group__slug=group)
+    if author:
+        posts = posts.filter(author__username=author)
+    return get_backend().search(posts, query)
@@ -0,0 +1,163 @@
+from django.contrib.auth import get_user_model
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from . import cache, feeds, search
+from .counters import bump_author_stats, bump_comment_count
+from .models import AuthorStats, Comment, Follow, Group, Post
+
+User = get_user_model()
+
+
+def invalidate_post(post_id, group_slugs=()):
+    post = Post.objects.filter(pk=post_id).select_related('author', 'group').first()
+    if post is not None:
+        cache.invalidate(*cache.post_scopes(post, group_slugs))
+
+
+def author_scopes(user, *usernames):
+    """Every scope showing a card of ``user``'s posts, under any of ``usernames``."""
+    groups = Post.objects.filter(author=user).exclude(group=None).values_list('group__slug', flat=True).distinct()
+    followers = Follow.objects.filter(author=user).values_list('user_id', flat=True)
+    return [cache.global_scope(), cache.users_scope(),
+            *(cache.author_scope(username) for username in usernames),
+            *(cache.group_scope(slug) for slug in groups),
+            *(cache.follow_scope(user_id) for user_id in followers)]
+
+
+@receiver(post_save, sender=User)
+def create_author_stats(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        AuthorStats.objects.get_or_create(user=instance)
+        cache.invalidate(cache.users_scope())
+
+
+@receiver(pre_save, sender=User)
+def remember_username(sender, instance, raw=False, update_fields=None, **kwargs):
+    # Logins save last_login only.
+    if instance.pk and not raw and (update_fields is None or 'username' in update_fields):
+        instance._previous_username = User.objects.filter(pk=instance.pk).values_list('username', flat=True).first()
+
+
+@receiver(post_save, sender=User)
+def user_renamed(sender, instance, created, raw=False, **kwargs):
+    previous = getattr(instance, '_previous_username', None)
+    if created or raw or previous in (None, instance.username):
+        return
+    cache.invalidate(*author_scopes(instance, previous, instance.username))
+    cache.invalidate_cards(Post.objects.filter(author=instance).only('id', 'comment_count').iterator())
+
+
+@receiver(post_delete, sender=User)
+def user_deleted(sender, instance, **kwargs):
+    # Posts, comments and follows went first, through their own receivers.
+    cache.invalidate(cache.users_scope(), cache.author_scope(instance.username))
+
+
+@receiver(pre_save, sender=Post)
+def remember_group(sender, instance, raw=False, **kwargs):
+    if instance.pk and not raw:
+        instance._previous_group_slug = (Post.objects.filter(pk=instance.pk)
+                                         .values_list('group__slug', flat=True).first())
+
+
+@receiver(post_save, sender=Post)
+def post_saved(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    if update_fields is None or 'text' in update_fields:
+        search.index_posts([instance.pk])
+    if raw:
+        return
+    if created:
+        bump_author_stats(instance.author_id, posts_count=1)
+        feeds.fan_out(instance)
+        cache.invalidate(cache.users_scope())
+    cache.invalidate(*cache.post_scopes(instance, [getattr(instance, '_previous_group_slug', None)]))
+    cache.invalidate_cards([instance])
+
+
+@receiver(post_delete, sender=Post)
+def post_deleted(sender, instance, **kwargs):
+    bump_author_stats(instance.author_id, posts_count=-1)
+    search.remove_posts([instance.pk])
+    cache.invalidate(cache.users_scope(), *cache.post_scopes(instance))
+
+
+@receiver(post_save, sender=Comment)
+def comment_saved(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    if created:
+        bump_comment_count(instance.post_id, 1)
+    invalidate_post(instance.post_id)
+
+
+@receiver(post_delete, sender=Comment)
+def comment_deleted(sender, instance, **kwargs):
+    bump_comment_count(instance.post_id, -1)
+    invalidate_post(instance.post_id)
+
+
+@receiver(post_save, sender=Follow)
+def follow_created(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        bump_author_stats(instance.author_id, followers_count=1)
+        bump_author_stats(instance.user_id, following_count=1)
+        feeds.backfill(instance.user_id, instance.author_id)
+        invalidate_follow(instance)
+
+
+@receiver(post_delete, sender=Follow)
+def follow_deleted(sender, instance, **kwargs):
+    bump_author_stats(instance.author_id, followers_count=-1)
+    bump_author_stats(instance.user_id, following_count=-1)
+    feeds.prune(instance.user_id, instance.author_id)
+    if feeds.at_fanout_limit(instance.author_id):
+        followers = feeds.backfill_followers(instance.author_id)
+        cache.invalidate(*(cache.follow_scope(user_id) for user_id in followers))
+    invalidate_follow(instance)
+
+
+def invalidate_follow(follow):
+    cache.invalidate(cache.users_scope(),
+                     cache.follow_scope(follow.user_id),
+                     cache.author_scope(follow.user.username),
+                     cache.author_scope(follow.author.username))
+
+
+def group_posts_scopes(group):
+    """The feeds showing cards of ``group``'s posts, which link to it."""
+    authors = Post.objects.filter(group=group).values_list('author__username', flat=True).distinct()
+    followers = Follow.objects.filter(author__posts__group=group).values_list('user_id', flat=True).distinct()
+    return [cache.global_scope(),
+            *(cache.author_scope(username) for username in authors),
+            *(cache.follow_scope(user_id) for user_id in followers)]
+
+
+@receiver(pre_save, sender=Group)
+def remember_slug(sender, instance, raw=False, **kwargs):
+    if instance.pk and not raw:
+        instance._previous_slug = Group.objects.filter(pk=instance.pk).values_list('slug', flat=True).first()
+
+
+@receiver(post_save, sender=Group)
+def group_saved(sender, instance, raw=False, **kwargs):
+    if not raw:
+        previous = getattr(instance, '_previous_slug', None)
+        scopes = [cache.group_scope(instance.slug)]
+        if previous not in (None, instance.slug):
+            scopes += [cache.group_scope(previous), *group_posts_scopes(instance)]
+        cache.invalidate(*scopes)
+        cache.invalidate_cards(Post.objects.filter(group=instance).only('id', 'comment_count').iterator())
+
+
+@receiver(pre_delete, sender=Group)
+def group_deleting(sender, instance, **kwargs):
+    # Its posts lose the group before post_delete, without post_save.
+    instance._scopes = group_posts_scopes(instance)
+    instance._cards = list(Post.objects.filter(group=instance).only('id', 'comment_count'))
+
+
+@receiver(post_delete, sender=Group)
+def group_deleted(sender, instance, **kwargs):
+    cache.invalidate(cache.group_scope(instance.slug), *getattr(instance, '_scopes', ()))
+    cache.invalidate_cards(getattr(instance, '_cards', ()))
@@ -0,0 +1,40 @@
+"""
+Feed pages sent in pieces.
+
+The page template is rendered once with a marker where the post cards go
+(templates check ``stream_cards``); everything before the marker, the head,
+navigation and menu, is sent straight away, then the cards a few at a time
+from the card cache, then the rest of the page. Only the sync views
+stream: an ASGI server would iterate the chunks on the event loop.
+"""
+from django.conf import settings
+from django.http import StreamingHttpResponse
+from django.shortcuts import render
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+
+from .templatetags.post_cards import render_cards
+
+CARDS_MARKER = mark_safe('<!-- post cards -->')
+
+
+def stream_cards(posts, user, separator=''):
+    per_chunk = settings.STREAM_CARDS_PER_CHUNK
+    for start in range(0, len(posts), per_chunk):
+        cards = render_cards(posts[start:start + per_chunk], user)
+        yield (separator if start else '') + separator.join(cards)
+
+
+def render_feed(request, template_name, context, separator=''):
+    """``render()`` for a feed page, streamed when STREAM_FEED_PAGES is on."""
+    if not settings.STREAM_FEED_PAGES:
+        return render(request, template_name, context)
+    html = render_to_string(template_name, {**context, 'stream_cards': CARDS_MARKER}, request)
+    head, tail = html.split(CARDS_MARKER, 1)
+    posts = list(context['page'])
+
+    def content():
+        yield head
+        yield from stream_cards(posts, request.user, separator)
+        yield tail
+    return StreamingHttpResponse(content(), content_type='text/html; charset=utf-8')
@@ -0,0 +1,51 @@
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import django
+from django.conf import settings
+from django.db import close_old_connections, connections, transaction
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=settings.BACKGROUND_WORKERS,
+                                           thread_name_prefix='yatube-worker')
+    return _executor
+
+
+def _run(func, args, kwargs):
+    close_old_connections()
+    try:
+        func(*args, **kwargs)
+    except Exception:
+        logger.exception('Background task %s failed', func.__name__)
+    finally:
+        connections.close_all()
+
+
+def run_in_background(func, *args, **kwargs):
+    """
+    Run ``func`` on the in-process worker pool once the current transaction
+    commits. With BACKGROUND_TASKS_EAGER the call happens inline instead.
+    """
+    def submit():
+        if settings.BACKGROUND_TASKS_EAGER:
+            func(*args, **kwargs)
+        else:
+            get_executor().submit(_run, func, args, kwargs)
+    transaction.on_commit(submit)
+
+
+def setup_process(settings_module):
+    """Initializer for spawned worker processes that use the ORM; importing this module touches no models."""
+    os.environ['DJANGO_SETTINGS_MODULE'] = settings_module
+    django.setup()
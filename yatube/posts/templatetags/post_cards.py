@@ -0,0 +1,86 @@
+from django import template
+from django.core.cache import cache
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.template.loader import render_to_string
+from django.urls import reverse
+from django.utils.html import format_html
+from django.utils.safestring import mark_safe
+
+from posts import thumbnails
+from posts.cache import card_key
+
+register = template.Library()
+
+EDIT_SLOT = '<!--post-edit:{}-->'
+CARD_SIZES = '(min-width: 1200px) 1110px, 100vw'
+
+
+def edit_link(post):
+    url = reverse('post_edit', args=[post.author.username, post.pk])
+    return format_html('<a class="btn btn-sm text-muted" href="{}" role="button">Редактировать</a>', url)
+
+
+def render_cards(posts, user=None):
+    """
+    Render the cards of a feed page from cached fragments.
+
+    Cards are cached without the viewer-specific edit link; a marker left in
+    its place is filled in for the viewer's own posts.
+    """
+    posts = list(posts)
+    cached = cache.get_many([card_key(post) for post in posts])
+    rendered = {}
+    for post in posts:
+        if card_key(post) not in cached:
+            rendered[card_key(post)] = render_to_string('post.html', {'post': post, 'cached_card': True})
+    if rendered:
+        cache.set_many(rendered, settings.CARD_CACHE_TIMEOUT)
+        cached.update(rendered)
+
+    cards = []
+    for post in posts:
+        link = edit_link(post) if user is not None and user == post.author else ''
+        cards.append(mark_safe(cached[card_key(post)].replace(EDIT_SLOT.format(post.pk), link)))
+    return cards
+
+
+@register.simple_tag(takes_context=True)
+def post_cards(context, posts):
+    return render_cards(posts, context.get('user'))
+
+
+@register.simple_tag
+def card_thumbnail(post):
+    """
+    A thumbnail generated earlier by sorl, or None. Missing images are
+    queued for the responsive variant pipeline instead.
+    """
+    if not post.image:
+        return None
+    thumbnail = thumbnails.card_thumbnail(post.image)
+    if thumbnail is None:
+        thumbnails.schedule_image_processing(post)
+    return thumbnail
+
+
+@register.simple_tag
+def card_picture(post):
+    """``<picture>`` sources for a post whose responsive variants are ready."""
+    variants = post.image_variants
+    if not post.image or variants.get('source') != post.image.name:
+        return None
+    sources = []
+    for mime, files in variants['sources'].items():
+        srcset = ', '.join(f"{default_storage.url(item['name'])} {item['width']}w" for item in files)
+        sources.append({'type': mime, 'srcset': srcset, 'files': files})
+    fallback = sources[-1]
+    largest = fallback['files'][-1]
+    return {
+        'sources': sources[:-1],
+        'srcset': fallback['srcset'],
+        'src': default_storage.url(largest['name']),
+        'width': largest['width'],
+        'height': largest['height'],
+        'sizes': CARD_SIZES,
+    }
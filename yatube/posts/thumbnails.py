@@ -0,0 +1,93 @@
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from django.db import transaction
+
+from sorl.thumbnail import default, get_thumbnail
+from sorl.thumbnail.base import ThumbnailBackend
+from sorl.thumbnail.conf import defaults as default_settings, settings as thumbnail_settings
+from sorl.thumbnail.images import ImageFile
+
+from . import cache, images
+from .models import Post
+from .tasks import run_in_background
+
+CARD_GEOMETRY = '960x339'
+CARD_OPTIONS = {'crop': 'center', 'upscale': True}
+
+_pending = set()
+_pending_lock = threading.Lock()
+
+_image_pool = None
+_image_pool_lock = threading.Lock()
+
+
+class QueuedThumbnailBackend(ThumbnailBackend):
+    def get_cached_thumbnail(self, file_, geometry_string, **options):
+        """Return the thumbnail if it has already been generated, otherwise None."""
+        source = ImageFile(file_)
+        if thumbnail_settings.THUMBNAIL_PRESERVE_FORMAT:
+            options.setdefault('format', self._get_format(source))
+        for key, value in self.default_options.items():
+            options.setdefault(key, value)
+        for key, attr in self.extra_options:
+            value = getattr(thumbnail_settings, attr)
+            if value != getattr(default_settings, attr):
+                options.setdefault(key, value)
+        name = self._get_thumbnail_filename(source, geometry_string, options)
+        return default.kvstore.get(ImageFile(name, default.storage))
+
+
+def card_thumbnail(image):
+    return default.backend.get_cached_thumbnail(image, CARD_GEOMETRY, **CARD_OPTIONS)
+
+
+def get_image_pool():
+    global _image_pool
+    with _image_pool_lock:
+        if _image_pool is None:
+            _image_pool = ProcessPoolExecutor(max_workers=settings.IMAGE_WORKERS,
+                                              mp_context=multiprocessing.get_context('spawn'))
+    return _image_pool
+
+
+def build_variants(name):
+    if settings.IMAGE_WORKERS:
+        return get_image_pool().submit(images.build_variants, settings.MEDIA_ROOT, name).result()
+    return images.build_variants(settings.MEDIA_ROOT, name)
+
+
+def store_variants(post, variants):
+    # Only keep the result if the image was not replaced in the meantime.
+    Post.objects.filter(pk=post.pk, image=variants['source']).update(image_variants=variants)
+    post.image_variants = variants
+    cache.invalidate_cards([post])
+    cache.invalidate(*cache.post_scopes(post))
+
+
+def process_post_image(post_id):
+    try:
+        post = Post.objects.select_related('author', 'group').get(pk=post_id)
+        if post.image:
+            # The sorl thumbnail is the fallback until the variants are stored.
+            get_thumbnail(post.image, CARD_GEOMETRY, **CARD_OPTIONS)
+            store_variants(post, build_variants(post.image.name))
+    finally:
+        with _pending_lock:
+            _pending.discard(post_id)
+
+
+def _enqueue(post_id):
+    with _pending_lock:
+        if post_id in _pending:
+            return
+        _pending.add(post_id)
+    run_in_background(process_post_image, post_id)
+
+
+def schedule_image_processing(post):
+    """Build the responsive variants in the background after the transaction commits."""
+    post_id = post.pk
+    transaction.on_commit(lambda: _enqueue(post_id))
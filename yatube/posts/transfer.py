@@ -0,0 +1,379 @@
+"""
+Move users, groups, posts, comments and follows between instances.
+
+Exports stream rows with server-side iteration to NDJSON (one object per
+line with a ``type`` key) or to a directory of CSV files, one per type.
+Imports read the same formats in chunks: every chunk is one transaction
+of ``bulk_create`` calls that skip the model signals, so counters, feeds,
+the search index and the page caches are rebuilt once at the end.
+
+Users are matched by username and groups by slug. Posts and comments get
+new ids on the target, so they never collide with rows already there: a
+post matches an existing one with the same author, date and text, and
+comments are attached through the map from exported to new post ids, kept
+in the ImportedPost table for the run and written with each chunk of posts.
+Progress is checkpointed to a state file with the run's id, and a rerun
+skips the chunks that were already committed; rows of chunks that were
+committed but not yet checkpointed are matched, not duplicated.
+"""
+import csv
+import json
+import os
+import random
+import shutil
+import time
+import uuid
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from contextlib import contextmanager
+from itertools import groupby
+from multiprocessing import get_context
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.db import OperationalError, transaction
+from django.db.models import F
+from django.utils.dateparse import parse_datetime
+
+from .counters import rebuild_counters
+from .feeds import rebuild_feeds
+from .freshness import touch_all
+from .models import Comment, Follow, Group, ImportedPost, Post
+from .search import rebuild_index
+from .tasks import setup_process
+
+User = get_user_model()
+
+BATCH_SIZE = 1000
+LOCK_RETRIES = 20
+TYPES = ('user', 'group', 'post', 'comment', 'follow')
+COLUMNS = {
+    'user': ['username', 'first_name', 'last_name', 'email', 'password', 'is_active', 'date_joined'],
+    'group': ['slug', 'title', 'description'],
+    'post': ['id', 'author', 'group', 'text', 'pub_date', 'image'],
+    'comment': ['id', 'post', 'author', 'text', 'date_created'],
+    'follow': ['user', 'author'],
+}
+
+
+def export_records(batch_size=BATCH_SIZE):
+    """Yield ``(type, record)`` for every row, parents before children."""
+    querysets = {
+        'user': User.objects.values(*COLUMNS['user']),
+        'group': Group.objects.values(*COLUMNS['group']),
+        'post': Post.objects.values('id', 'text', 'pub_date', 'image',
+                                    author_name=F('author__username'), group_slug=F('group__slug')),
+        'comment': Comment.objects.values('id', 'text', 'date_created', post_ref=F('post_id'),
+                                          author_name=F('author__username')),
+        'follow': Follow.objects.values(user_name=F('user__username'), author_name=F('author__username')),
+    }
+    renames = {'author_name': 'author', 'group_slug': 'group', 'post_ref': 'post', 'user_name': 'user'}
+    for kind in TYPES:
+        for row in querysets[kind].order_by('pk').iterator(chunk_size=batch_size):
+            row = {renames.get(name, name): value for name, value in row.items()}
+            yield kind, {name: row[name] for name in COLUMNS[kind]}
+
+
+def copy_image(name, source, target):
+    """Copy a post image between a storage and a plain directory, if it is not there yet."""
+    if not name:
+        return
+    if target is None:
+        path = os.path.join(source, name)
+        if os.path.exists(path) and not default_storage.exists(name):
+            with open(path, 'rb') as content:
+                default_storage.save(name, File(content))
+        return
+    path = os.path.join(target, name)
+    if not os.path.exists(path) and default_storage.exists(name):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with default_storage.open(name) as content, open(path, 'wb') as out:
+            shutil.copyfileobj(content, out)
+
+
+class NDJSONWriter:
+    def __init__(self, stream):
+        self.stream = stream
+
+    def write(self, kind, record):
+        # Full precision: DjangoJSONEncoder would cut datetimes to milliseconds.
+        record = {name: value.isoformat() if hasattr(value, 'isoformat') else value for name, value in record.items()}
+        self.stream.write(json.dumps({'type': kind, **record}, ensure_ascii=False) + '\n')
+
+    def close(self):
+        self.stream.flush()
+
+
+def csv_value(value):
+    if value is None:
+        return ''
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    return value
+
+
+class CSVWriter:
+    def __init__(self, directory):
+        self.directory = directory
+        self.files = {}
+        self.writers = {}
+        os.makedirs(directory, exist_ok=True)
+
+    def write(self, kind, record):
+        if kind not in self.writers:
+            self.files[kind] = open(os.path.join(self.directory, f'{kind}s.csv'), 'w', newline='', encoding='utf-8')
+            self.writers[kind] = csv.DictWriter(self.files[kind], COLUMNS[kind])
+            self.writers[kind].writeheader()
+        self.writers[kind].writerow({name: csv_value(value) for name, value in record.items()})
+
+    def close(self):
+        for file in self.files.values():
+            file.close()
+
+
+def export_content(writer, media=None, batch_size=BATCH_SIZE):
+    count = 0
+    for kind, record in export_records(batch_size):
+        writer.write(kind, record)
+        if media and kind == 'post':
+            copy_image(record['image'], None, media)
+        count += 1
+    writer.close()
+    return count
+
+
+def read_ndjson(stream):
+    for line in stream:
+        if line.strip():
+            record = json.loads(line)
+            yield record.pop('type'), record
+
+
+def read_csv(directory):
+    for kind in TYPES:
+        path = os.path.join(directory, f'{kind}s.csv')
+        if os.path.exists(path):
+            with open(path, newline='', encoding='utf-8') as file:
+                for row in csv.DictReader(file):
+                    yield kind, {name: value if value != '' else None for name, value in row.items()}
+
+
+@contextmanager
+def preserve_dates():
+    """bulk_create would stamp auto_now_add fields with the import time."""
+    fields = [Post._meta.get_field('pub_date'), Comment._meta.get_field('date_created')]
+    for field in fields:
+        field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field in fields:
+            field.auto_now_add = True
+
+
+def user_ids(usernames):
+    return dict(User.objects.filter(username__in=set(usernames)).values_list('username', 'id'))
+
+
+def load_users(records, media, run):
+    existing = set(User.objects.filter(username__in=[record['username'] for record in records])
+                   .values_list('username', flat=True))
+    User.objects.bulk_create(
+        [User(username=record['username'], first_name=record['first_name'] or '',
+              last_name=record['last_name'] or '', email=record['email'] or '', password=record['password'] or '',
+              is_active=record['is_active'] not in (False, 'False', '0'),
+              date_joined=parse_datetime(record['date_joined']))
+         for record in records if record['username'] not in existing],
+        ignore_conflicts=True)
+
+
+def load_groups(records, media, run):
+    existing = set(Group.objects.filter(slug__in=[record['slug'] for record in records])
+                   .values_list('slug', flat=True))
+    Group.objects.bulk_create([Group(slug=record['slug'], title=record['title'],
+                                     description=record['description'] or '')
+                               for record in records if record['slug'] not in existing])
+
+
+def post_key(post):
+    return post.author_id, post.pub_date, post.text
+
+
+def load_posts(records, media, run):
+    """Insert the posts that are not there yet and record their new ids for the run."""
+    authors = user_ids(record['author'] for record in records)
+    groups = dict(Group.objects.filter(slug__in={record['group'] for record in records if record['group']})
+                  .values_list('slug', 'id'))
+    loaded = {int(record['id']): Post(author_id=authors[record['author']], group_id=groups.get(record['group']),
+                                      text=record['text'], pub_date=parse_datetime(record['pub_date']),
+                                      image=record['image'] or '')
+              for record in records if record['author'] in authors}
+    existing = {post_key(post): post.pk for post in Post.objects.filter(
+        author_id__in={post.author_id for post in loaded.values()},
+        pub_date__in={post.pub_date for post in loaded.values()}).only('author_id', 'pub_date', 'text')}
+    with preserve_dates():
+        Post.objects.bulk_create([post for post in loaded.values() if post_key(post) not in existing])
+    if media:
+        for post in loaded.values():
+            copy_image(post.image.name, media, None)
+    ImportedPost.objects.bulk_create(
+        [ImportedPost(run=run, source_id=source, post_id=existing.get(post_key(post), post.pk))
+         for source, post in loaded.items()],
+        ignore_conflicts=True)
+
+
+def load_comments(records, media, run):
+    """Comments are attached to their posts through the run's ImportedPost rows."""
+    posts = dict(ImportedPost.objects.filter(run=run, source_id__in={int(record['post']) for record in records})
+                 .values_list('source_id', 'post_id'))
+    authors = user_ids(record['author'] for record in records)
+    comments = [Comment(post_id=posts[int(record['post'])], author_id=authors[record['author']],
+                        text=record['text'], date_created=parse_datetime(record['date_created']))
+                for record in records if record['author'] in authors and int(record['post']) in posts]
+    existing = set(Comment.objects.filter(post_id__in={comment.post_id for comment in comments})
+                   .values_list('post_id', 'author_id', 'date_created', 'text'))
+    with preserve_dates():
+        Comment.objects.bulk_create([
+            comment for comment in comments
+            if (comment.post_id, comment.author_id, comment.date_created, comment.text) not in existing])
+
+
+def load_follows(records, media, run):
+    users = user_ids([record['user'] for record in records] + [record['author'] for record in records])
+    Follow.objects.bulk_create(
+        [Follow(user_id=users[record['user']], author_id=users[record['author']])
+         for record in records
+         if record['user'] in users and record['author'] in users and record['user'] != record['author']],
+        ignore_conflicts=True)
+
+
+LOADERS = {'user': load_users, 'group': load_groups, 'post': load_posts, 'comment': load_comments,
+           'follow': load_follows}
+
+
+def load_chunk(kind, records, media=None, run=None):
+    """Load one chunk of the import ``run``."""
+    for attempt in range(LOCK_RETRIES):
+        try:
+            with transaction.atomic():
+                return LOADERS[kind](records, media, run)
+        except OperationalError as error:
+            # SQLite lets one process write at a time; parallel chunks take turns.
+            if 'locked' not in str(error) or attempt == LOCK_RETRIES - 1:
+                raise
+            time.sleep(random.uniform(0, min(2 ** attempt * 0.05, 2)))
+
+
+class InlineExecutor:
+    def submit(self, func, *args):
+        future = Future()
+        try:
+            future.set_result(func(*args))
+        except Exception as error:
+            future.set_exception(error)
+        return future
+
+    def shutdown(self):
+        pass
+
+
+class Checkpoint:
+    """The number of leading records that are committed and the run id, kept in a JSON file."""
+
+    def __init__(self, path):
+        self.path = path
+        state = {}
+        if path and os.path.exists(path):
+            with open(path) as file:
+                state = json.load(file)
+        self.done = state.get('done', 0)
+        self.run = state.get('run') or uuid.uuid4().hex
+        self.finished = {}
+
+    def complete(self, start, end):
+        self.finished[start] = end
+        while self.done in self.finished:
+            self.done = self.finished.pop(self.done)
+        if self.path:
+            with open(f'{self.path}.tmp', 'w') as file:
+                json.dump({'done': self.done, 'run': self.run}, file)
+            os.replace(f'{self.path}.tmp', self.path)
+
+    def clear(self):
+        ImportedPost.objects.filter(run=self.run).delete()
+        if self.path and os.path.exists(self.path):
+            os.remove(self.path)
+
+
+def chunks(records, batch_size, skip):
+    """Yield ``(start, type, records)``; a chunk never mixes types."""
+    position = 0
+    for kind, group in groupby(records, key=lambda item: item[0]):
+        batch = []
+        for _, record in group:
+            position += 1
+            if position <= skip:
+                continue
+            batch.append(record)
+            if len(batch) == batch_size:
+                yield position - len(batch), kind, batch
+                batch = []
+        if batch:
+            yield position - len(batch), kind, batch
+
+
+def rebuild_all():
+    """Everything the signals would have maintained row by row."""
+    with transaction.atomic():
+        rebuild_counters()
+        rebuild_feeds()
+        rebuild_index()
+        touch_all()
+    # Cached pages are keyed on scope versions that bulk inserts did not bump.
+    cache.clear()
+
+
+def import_content(records, batch_size=BATCH_SIZE, workers=0, state=None, media=None, stdout=None):
+    """
+    Load ``(type, record)`` pairs with up to ``workers`` processes (0 loads
+    in this process). Types must come in dependency order, as exported;
+    chunks of one type run in parallel and the next type waits for them.
+    """
+    checkpoint = Checkpoint(state)
+    if workers:
+        executor = ProcessPoolExecutor(max_workers=workers, mp_context=get_context('spawn'),
+                                       initializer=setup_process, initargs=(os.environ['DJANGO_SETTINGS_MODULE'],))
+    else:
+        executor = InlineExecutor()
+    in_flight, current, loaded = {}, None, checkpoint.done
+
+    def settle(futures):
+        nonlocal loaded
+        for future in futures:
+            start, size = in_flight.pop(future)
+            future.result()
+            checkpoint.complete(start, start + size)
+            loaded += size
+        if stdout is not None:
+            stdout.write(f'{loaded} records loaded')
+
+    try:
+        for start, kind, batch in chunks(records, batch_size, checkpoint.done):
+            if kind != current and in_flight:
+                settle(wait(in_flight).done)
+            current = kind
+            in_flight[executor.submit(load_chunk, kind, batch, media, checkpoint.run)] = (start, len(batch))
+            if len(in_flight) >= max(workers, 1) * 2:
+                settle(wait(in_flight, return_when=FIRST_COMPLETED).done)
+        settle(wait(in_flight).done)
+    except BaseException:
+        # Without a state file the run cannot be resumed.
+        if not state:
+            checkpoint.clear()
+        raise
+    finally:
+        executor.shutdown()
+    rebuild_all()
+    checkpoint.clear()
+    return loaded
@@ -1,21 +1,32 @@
+from django.conf import settings
 from django.urls import path
 
-from . import views
+from . import api, async_views, views
+
+feeds = async_views if settings.ASYNC_VIEWS else views
 
 
 urlpatterns = [
-    path('', views.index, name="index"),
-    path('group/<slug:slug>/', views.group_posts, name="group"),
+    path('', feeds.index, name="index"),
+    path('group/<slug:slug>/', feeds.group_posts, name="group"),
     path('new/', views.new_post, name='new_post'),
+    path('search/', views.search, name='search'),
 
-    path('follow/', views.follow_index, name="follow"),
+    path('follow/', feeds.follow_index, name="follow"),
 
-    path('users/', views.users_view, name="users"),
+    path('users/', views.authors, name="users"),
     path("users/<str:username>/follow/", views.profile_follow, name="profile_follow"),
     path("users/<str:username>/unfollow/", views.profile_unfollow, name="profile_unfollow"),
 
-    path('users/<str:username>/', views.profile, name='profile'),
-    path('users/<str:username>/<int:post_id>/', views.post_view, name='post'),
+    path('users/<str:username>/', feeds.profile, name='profile'),
+    path('users/<str:username>/<int:post_id>/', feeds.post_view, name='post'),
+    path('users/<str:username>/<int:post_id>/comments/', views.post_comments, name='post_comments'),
     path('users/<str:username>/<int:post_id>/edit/', views.post_edit, name='post_edit'),
     path("users/<str:username>/<int:post_id>/comment", views.add_comment, name="add_comment"),
+
+    path('api/posts/', api.index, name='api_index'),
+    path('api/group/<slug:slug>/', api.group_posts, name='api_group'),
+    path('api/follow/', api.follow_index, name='api_follow'),
+    path('api/users/<str:username>/', api.profile, name='api_profile'),
+    path('api/users/<str:username>/<int:post_id>/', api.post_view, name='api_post'),
 ]
\ No newline at end of file
@@ -1,54 +1,128 @@
 from django.shortcuts import render, get_object_or_404, redirect, get_list_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth import get_user_model
-from django.views.decorators.cache import cache_page
-from django.core.paginator import Paginator
+from django.http import JsonResponse
+from django.urls import reverse
+from django.utils.http import urlencode
 
-from .models import Post, Group, Comment, Follow
+from yatube.db import read_replica
+from yatube.sqlite.writer import write
+
+from .models import Post, Group, Comment, Follow, AuthorStats
 from .forms import PostForm, CommentForm
+from .feeds import follow_feed
+from .thumbnails import schedule_image_processing
+from .budgets import budget
+from .cache import (cache_feed, index_scopes, users_scopes, group_scopes, profile_scopes, post_view_scopes,
+                    follow_scopes, group_exists, profile_exists, post_exists)
+from .freshness import conditional
+from .paginator import CursorPaginator, approximate_count
+from .search import search_posts
+from .streaming import render_feed
 
 User = get_user_model()
 
+AUTHOR_ORDERINGS = {
+    'activity': ('-posts_count', '-user_id'),
+    'followers': ('-followers_count', '-user_id'),
+}
+# Upper bound for a username prefix range: sorts after every other character.
+LAST_CHAR = chr(0x10FFFF)
+COMMENTS_PER_PAGE = 20
 
-def pagination(request, posts, num):
-    paginator = Paginator(posts, 10)
-    page_number = request.GET.get('page')
-    page = paginator.get_page(page_number)
-    return page, paginator
 
+def save_post(post, update_fields=None, process_image=True):
+    post.save(update_fields=update_fields)
+    if post.image and process_image:
+        schedule_image_processing(post)
 
-@cache_page(20, key_prefix='index_page')
-def index(request):
-    posts = list(Post.objects.order_by('-pub_date')
-                 .select_related('author', 'group')
-                 .prefetch_related('comments')
-                 )
-    page, paginator = pagination(request, posts, 10)
-    return render(request, 'index.html', {'page': page,
-                                          'paginator': paginator,
-                                          'title': 'Последние обновления на сайте',
-                                          'index': True
-                                          })
 
+def comment_pagination(request, comments, num=COMMENTS_PER_PAGE):
+    """Oldest first, so a thread reads top to bottom and later batches are appended."""
+    paginator = CursorPaginator(comments.select_related('author'), num, ordering=('date_created', 'id'))
+    return paginator.get_page(request.GET.get('cursor'))
 
-@cache_page(29, key_prefix='users_page')
-def users_view(request):
-    authors = list(User.objects.all())
-    return render(request, 'index.html', {'authors': authors, 'title': 'Список авторов'})
 
+def pagination(request, posts, num=10, count=None, ordering=('-pub_date', '-id'), transform=None):
+    paginator = CursorPaginator(posts, num, ordering=ordering, count=count, transform=transform)
+    page = paginator.get_page(request.GET.get('cursor'))
+    return page, paginator
 
-@cache_page(20, key_prefix='group_page')
-def group_posts(request, slug):
-    group = get_object_or_404(Group, slug=slug)
-    posts = list(Post.objects.filter(group=group)
-                 .select_related('author', 'group')
-                 .order_by('-pub_date')
-                 .prefetch_related('comments')
-                 )
-    page, paginator = pagination(request, posts, 10)
-    return render(request, 'group.html', {'group': group, 'page': page, 'paginator': paginator})
+
+@read_replica
+@budget(queries=5, p95_ms=150)
+@conditional(index_scopes)
+@cache_feed(index_scopes)
+def index(request):
+    posts = (Post.objects
+             .select_related('author', 'group')
+             )
+    page, paginator = pagination(request, posts, 10, count=approximate_count('index', Post.objects.all()))
+    return render_feed(request, 'index.html', {'page': page,
+                                               'paginator': paginator,
+                                               'title': 'Последние обновления на сайте',
+                                               'index': True
+                                               })
+
+
+@read_replica
+@budget(queries=4, p95_ms=150)
+@cache_feed(users_scopes)
+def authors(request):
+    order = request.GET.get('order')
+    if order not in AUTHOR_ORDERINGS:
+        order = 'activity'
+    prefix = request.GET.get('q', '').strip()
+    authors = AuthorStats.objects.select_related('user')
+    count = approximate_count('authors', authors)
+    if prefix:
+        # A range rather than LIKE, so the unique index on username is used.
+        authors = authors.filter(user__username__gte=prefix, user__username__lt=prefix + LAST_CHAR)
+        count = None
+    page, paginator = pagination(request, authors, 20, ordering=AUTHOR_ORDERINGS[order], count=count)
+    params = {'q': prefix} if prefix else {}
+    return render(request, 'authors.html', {'page': page,
+                                            'paginator': paginator,
+                                            'q': prefix,
+                                            'order': order,
+                                            'query': urlencode({**params, 'order': order}) + '&',
+                                            'directory': True,
+                                            })
 
 
+@read_replica
+@budget(queries=6, p95_ms=150)
+@conditional(group_scopes, group_exists)
+@cache_feed(group_scopes)
+def group_posts(request, slug):
+    group = get_object_or_404(Group, slug=slug)
+    posts = (Post.objects.filter(group=group)
+             .select_related('author', 'group')
+             )
+    page, paginator = pagination(request, posts, 10, count=approximate_count(f'group:{group.pk}', posts))
+    return render_feed(request, 'group.html', {'group': group, 'page': page, 'paginator': paginator},
+                       separator='<hr>')
+
+
+@budget(queries=6, p95_ms=150)
+def search(request):
+    query = request.GET.get('q', '').strip()
+    filters = {name: request.GET.get(name, '').strip() for name in ('group', 'author')}
+    page = paginator = None
+    if query:
+        posts = search_posts(query, **filters)
+        page, paginator = pagination(request, posts, 10, ordering=('-rank', '-id'))
+    params = {name: value for name, value in [('q', query), *filters.items()] if value}
+    return render(request, 'search.html', {'page': page,
+                                           'paginator': paginator,
+                                           'q': query,
+                                           'groups': Group.objects.order_by('title'),
+                                           'query': urlencode(params) + '&' if params else '',
+                                           **filters,
+                                           })
+
+
+@budget(queries=4, p95_ms=100)
 @login_required(redirect_field_name='login')
 def new_post(request):
     title = 'Новая запись'
@@ -59,7 +133,7 @@ def new_post(request):
             post = form.save(commit=False)
             user = request.user
             post.author = user
-            post.save()
+            write(save_post, post)
             return redirect('post', user, post.id)
 
         return render(request, 'new_post.html', {'form': form, 'title': title, 'button': button})
@@ -68,32 +142,63 @@ def new_post(request):
     return render(request, 'new_post.html', {'form': form, 'title': title, 'button': button})
 
 
+@read_replica
+@budget(queries=6, p95_ms=150)
+@conditional(profile_scopes, profile_exists)
+@cache_feed(profile_scopes)
 def profile(request, username):
-    author = get_object_or_404(User, username=username)
-    following = Follow.objects.filter(user=request.user, author=author)
-    posts = list(Post.objects.filter(author=author)
-                 .select_related('author', 'group')
-                 .prefetch_related('comments')
-                 .order_by('-pub_date')
-                 )
-    page, paginator = pagination(request, posts, 10)
-    posts_count = len(posts)
-    return render(request, 'profile.html', {'page': page,
-                                            'paginator': paginator,
-                                            'author': author,
-                                            'count': posts_count,
-                                            'following': following,
-                                            })
+    author = get_object_or_404(User.objects.select_related('stats'), username=username)
+    stats = AuthorStats.for_user(author)
+    following = request.user.is_authenticated and Follow.objects.filter(user=request.user, author=author).exists()
+    posts = (Post.objects.filter(author=author)
+             .select_related('author', 'group')
+             )
+    page, paginator = pagination(request, posts, 10, count=stats.posts_count)
+    return render_feed(request, 'profile.html', {'page': page,
+                                                 'paginator': paginator,
+                                                 'author': author,
+                                                 'stats': stats,
+                                                 'count': stats.posts_count,
+                                                 'following': following,
+                                                 })
 
 
+@budget(queries=6, p95_ms=150)
+@conditional(post_view_scopes, post_exists)
 def post_view(request, username, post_id):
-    author = get_object_or_404(User, username=username)
-    post = get_object_or_404(Post, author=author, id=post_id)
-    comments = list(Comment.objects.filter(post=post))
-    posts_count = Post.objects.filter(author=author).count()
-    return render(request, 'profile.html', {'author': author, 'post': post, 'count': posts_count, 'items': comments})
+    author = get_object_or_404(User.objects.select_related('stats'), username=username)
+    post = get_object_or_404(Post.objects.select_related('group'), author=author, id=post_id)
+    stats = AuthorStats.for_user(author)
+    comments = comment_pagination(request, Comment.objects.filter(post=post))
+    return render(request, 'profile.html', {'author': author,
+                                            'stats': stats,
+                                            'post': post,
+                                            'count': stats.posts_count,
+                                            'items': comments
+                                            })
 
 
+@budget(queries=4, p95_ms=100)
+@conditional(post_view_scopes, post_exists)
+@cache_feed(post_view_scopes)
+def post_comments(request, username, post_id):
+    """The next batch of a comment thread, as an HTML fragment or, with ?format=json, as JSON."""
+    post = get_object_or_404(Post.objects.select_related('author'), author__username=username, id=post_id)
+    comments = comment_pagination(request, Comment.objects.filter(post=post))
+    if request.GET.get('format') == 'json':
+        next_url = None
+        if comments.has_next():
+            next_url = request.build_absolute_uri(
+                reverse('post_comments', args=[username, post_id]) + f'?format=json&cursor={comments.next_cursor}')
+        return JsonResponse({'comments': [{'id': comment.id,
+                                           'author': comment.author.username,
+                                           'text': comment.text,
+                                           'date_created': comment.date_created} for comment in comments],
+                             'next': next_url})
+    return render(request, 'comment_list.html', {'post': post, 'author': post.author, 'items': comments})
+
+
+@budget(queries=5, p95_ms=100)
 @login_required(redirect_field_name='login')
 def post_edit(request, username, post_id):
     if username == request.user.username:
@@ -103,7 +208,11 @@ def post_edit(request, username, post_id):
             if form.is_valid():
                 post = form.save(commit=False)
                 post.author = request.user
-                post.save()
+                image_changed = 'image' in form.changed_data
+                if image_changed:
+                    post.image_variants = {}
+                write(save_post, post, update_fields=['text', 'group', 'image', 'image_variants', 'author'],
+                      process_image=image_changed)
                 return redirect('post', username, post.id)
 
             return render(request, 'new_post.html', {'form': form,
@@ -124,6 +233,7 @@ def post_edit(request, username, post_id):
         return redirect('post', username, post_id)
 
 
+@budget(queries=5, p95_ms=100)
 @login_required(redirect_field_name='login')
 def add_comment(request, username, post_id):
     author = get_object_or_404(User, username=username)
@@ -134,24 +244,22 @@ def add_comment(request, username, post_id):
             comment = form.save(commit=False)
             comment.author = request.user
             comment.post = post
-            comment.save()
+            write(comment.save)
             return redirect('post', author.username, post.id)
 
-        return render(request, 'comments.html', {'form': form})
+        return render(request, 'comments.html', {'form': form, 'post': post})
 
     form = CommentForm()
-    return render(request, 'comments.html', {'form': form})
+    return render(request, 'comments.html', {'form': form, 'post': post})
 
 
-@cache_page(20, key_prefix='follow_page')
+@read_replica
+@budget(queries=6, p95_ms=150)
 @login_required
+@cache_feed(follow_scopes)
 def follow_index(request):
-    posts = list(Post.objects.filter(author__following__user=request.user)
-                 .select_related('author', 'group')
-                 .order_by('-pub_date')
-                 .prefetch_related('comments')
-                 )
-    page, paginator = pagination(request, posts, 10)
+    posts, ordering, transform = follow_feed(request.user)
+    page, paginator = pagination(request, posts, 10, ordering=ordering, transform=transform)
     return render(request, 'index.html', {'page': page,
                                           'paginator': paginator,
                                           'title': 'Посты избранных авторов',
@@ -159,23 +267,23 @@ def follow_index(request):
                                           })
 
 
+@budget(queries=16, p95_ms=150)
 @login_required
 def profile_follow(request, username):
     author = get_object_or_404(User, username=username)
     if request.user != author:
-        if not Follow.objects.filter(user=request.user, author=author):
-            follow = Follow.objects.create(user=request.user, author=author)
-            follow.save()
+        write(Follow.objects.get_or_create, user=request.user, author=author)
     return redirect('profile', username)
 
 
+@budget(queries=16, p95_ms=150)
 @login_required
 def profile_unfollow(request, username):
     author = get_object_or_404(User, username=username)
     if request.user != author:
-        author = get_object_or_404(User, username=username)
-        follow = get_object_or_404(Follow, user=request.user, author=author)
-        follow.delete()
+        follow = Follow.objects.filter(user=request.user, author=author).first()
+        if follow is not None:
+            write(follow.delete)
     return redirect('profile', username)
 
 
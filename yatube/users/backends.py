@@ -0,0 +1,41 @@
+"""
+Authentication backend that keeps session users in the cache.
+
+``AuthenticationMiddleware`` loads ``request.user`` lazily through the
+session's backend on every request that touches it, which is nearly every
+page (the navigation shows who is logged in). This backend answers from
+the cache and goes to ``auth_user`` for the whole row only on a miss. The
+password hash is never cached: it is left deferred, so checking the
+session hash loads just that column from the database, and a password
+change logs other sessions out as before. The signals drop the entry when
+a user changes.
+"""
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+from django.core.cache import cache
+from django.db import router
+
+User = get_user_model()
+
+
+def user_key(user_id):
+    return f'user:{user_id}'
+
+
+def forget_user(user_id):
+    cache.delete(user_key(user_id))
+
+
+class CachedModelBackend(ModelBackend):
+    def get_user(self, user_id):
+        names = [field.attname for field in User._meta.concrete_fields if field.attname != 'password']
+        # The field values rather than the instance: every request gets its own user object.
+        values = cache.get(user_key(user_id))
+        if values is not None:
+            user = User.from_db(router.db_for_write(User), names, values)
+            return user if self.user_can_authenticate(user) else None
+        user = super().get_user(user_id)
+        if user is not None:
+            cache.set(user_key(user_id), [getattr(user, name) for name in names], settings.USER_CACHE_TIMEOUT)
+        return user
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from yatube.batches import BATCH_SIZE
+from users.sessions import clear_expired_sessions
+
+
+class Command(BaseCommand):
+    help = 'Delete expired sessions in batches; run it from cron instead of clearsessions'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        deleted = clear_expired_sessions(options['batch_size'])
+        if deleted is None:
+            self.stdout.write('Sessions of this engine expire by themselves')
+        else:
+            self.stdout.write(self.style.SUCCESS(f'{deleted} expired sessions deleted'))
@@ -0,0 +1,23 @@
+from importlib import import_module
+
+from django.conf import settings
+from django.utils import timezone
+
+from yatube.batches import delete_in_batches
+
+
+def clear_expired_sessions(batch_size=None):
+    """
+    Delete expired sessions a batch at a time, rather than in the one
+    DELETE ``clearsessions`` runs; returns how many, or None for engines
+    whose sessions expire by themselves (cache, signed cookies).
+    """
+    store = import_module(settings.SESSION_ENGINE).SessionStore
+    if not hasattr(store, 'get_model_class'):
+        try:
+            store.clear_expired()
+        except NotImplementedError:
+            pass
+        return None
+    model = store.get_model_class()
+    return delete_in_batches(model.objects.filter(expire_date__lt=timezone.now()), batch_size)
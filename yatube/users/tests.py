@@ -1 +1,86 @@
-from django.test import TestCase
\ No newline at end of file
+from datetime import timedelta
+from io import StringIO
+
+from django.contrib.auth.models import User
+from django.contrib.sessions.models import Session
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from .backends import CachedModelBackend, user_key
+from .sessions import clear_expired_sessions
+
+
+class TestSessions(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('reader', 'reader@gmail.com', 'password1234')
+
+    def setUp(self):
+        cache.clear()
+
+    def table_queries(self, table):
+        self.client.get(reverse('index'))
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('index'))
+        self.assertTrue(response.wsgi_request.user.is_authenticated)
+        return [query['sql'] for query in queries if f'FROM "{table}"' in query['sql']]
+
+    def test_user_is_cached(self):
+        self.client.force_login(self.user)
+        # Only the password, for the session hash.
+        queries = self.table_queries('auth_user')
+        self.assertEqual(len(queries), 1)
+        self.assertRegex(queries[0], r'^SELECT "auth_user"."id", "auth_user"."password" FROM')
+        with self.assertNumQueries(0):
+            user = CachedModelBackend().get_user(self.user.pk)
+        self.assertEqual(user, self.user)
+        self.assertIsNot(user, CachedModelBackend().get_user(self.user.pk))
+
+    def test_password_is_not_cached(self):
+        self.client.force_login(self.user)
+        self.client.get(reverse('index'))
+        self.assertNotIn(self.user.password, cache.get(user_key(self.user.pk)))
+
+    def test_sessions_of_model_backend_stay_logged_in(self):
+        self.client.force_login(self.user, backend='django.contrib.auth.backends.ModelBackend')
+        self.assertTrue(self.client.get(reverse('index')).wsgi_request.user.is_authenticated)
+
+    def test_cached_user_follows_changes(self):
+        self.client.force_login(self.user)
+        self.client.get(reverse('index'))
+        User.objects.filter(pk=self.user.pk).update(first_name='Stale')
+        self.user.first_name = 'Fresh'
+        self.user.save()
+        self.assertEqual(CachedModelBackend().get_user(self.user.pk).first_name, 'Fresh')
+        self.user.set_password('changed5678')
+        self.user.save()
+        self.assertFalse(self.client.get(reverse('index')).wsgi_request.user.is_authenticated)
+
+    @override_settings(SESSION_ENGINE='django.contrib.sessions.backends.cached_db')
+    def test_cache_sessions(self):
+        self.client.force_login(self.user)
+        self.assertEqual(self.table_queries('django_session'), [])
+        self.assertTrue(Session.objects.exists())
+
+    @override_settings(SESSION_ENGINE='django.contrib.sessions.backends.signed_cookies')
+    def test_cookie_sessions(self):
+        self.client.force_login(self.user)
+        self.assertEqual(self.table_queries('django_session'), [])
+        self.assertFalse(Session.objects.exists())
+        self.assertIsNone(clear_expired_sessions())
+
+    @override_settings(SESSION_ENGINE='django.contrib.sessions.backends.db')
+    def test_clear_expired_sessions(self):
+        now = timezone.now()
+        Session.objects.bulk_create(Session(session_key=f'session{i}', session_data='',
+                                            expire_date=now + timedelta(days=1 if i < 2 else -1))
+                                    for i in range(7))
+        out = StringIO()
+        call_command('clear_expired_sessions', batch_size=2, stdout=out)
+        self.assertIn('5 expired sessions deleted', out.getvalue())
+        self.assertEqual(set(Session.objects.values_list('session_key', flat=True)), {'session0', 'session1'})
@@ -1,8 +1,15 @@
 import os
 
+from django.conf import settings
 from django.core.asgi import get_asgi_application
 
+from yatube.templating import precompile
+
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'yatube.settings')
+os.environ.setdefault('YATUBE_ASYNC_VIEWS', '1')
 
 application = get_asgi_application()
+
+if settings.TEMPLATE_PRECOMPILE:
+    precompile()
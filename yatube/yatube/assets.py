@@ -0,0 +1,48 @@
+"""
+Build the site's CSS and JS bundles from assets/src into assets/build,
+which is what STATICFILES_DIRS serves.
+
+The stylesheet is the part of Bootstrap the templates use, compiled with
+libsass (``pip install libsass``); scripts are minified with rjsmin when it
+is installed and copied as they are otherwise.
+"""
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+BUNDLES = {
+    'css/yatube.css': 'yatube.scss',
+    'js/yatube.js': 'yatube.js',
+}
+
+
+def compile_scss(path):
+    try:
+        import sass
+    except ImportError:
+        raise ImproperlyConfigured('Building the stylesheet needs libsass: pip install libsass')
+    return sass.compile(filename=str(path), include_paths=[str(settings.ASSETS_DIR / 'vendor')],
+                        output_style='compressed')
+
+
+def minify_js(path):
+    source = path.read_text(encoding='utf-8')
+    try:
+        import rjsmin
+    except ImportError:
+        return source
+    return rjsmin.jsmin(source)
+
+
+def build(output=None):
+    """Write every bundle; returns ``{name: size in bytes}``."""
+    source_dir = settings.ASSETS_DIR / 'src'
+    output = output or settings.ASSETS_DIR / 'build'
+    sizes = {}
+    for name, source in BUNDLES.items():
+        path = source_dir / source
+        content = compile_scss(path) if path.suffix == '.scss' else minify_js(path)
+        target = output / name
+        target.parent.mkdir(parents=True, exist_ok=True)
+        target.write_text(content, encoding='utf-8')
+        sizes[name] = target.stat().st_size
+    return sizes
@@ -0,0 +1,38 @@
+"""
+Walking a queryset a batch at a time.
+
+Rows are walked in primary key order, so a batch never rescans what the
+previous ones changed or removed, and every batch is its own short
+transaction.
+"""
+import logging
+
+from django.db import transaction
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 500
+
+
+def batches(queryset, batch_size=None):
+    """Yield lists of primary keys of ``queryset``, BATCH_SIZE at a time by default."""
+    batch_size = batch_size or BATCH_SIZE
+    queryset = queryset.order_by('pk').values_list('pk', flat=True)
+    last = None
+    while True:
+        ids = list((queryset if last is None else queryset.filter(pk__gt=last))[:batch_size])
+        if not ids:
+            return
+        yield ids
+        last = ids[-1]
+
+
+def delete_in_batches(queryset, batch_size=None):
+    model = queryset.model
+    deleted = 0
+    for ids in batches(queryset, batch_size):
+        with transaction.atomic():
+            _, per_model = model.objects.filter(pk__in=ids).delete()
+        deleted += per_model.get(model._meta.label, 0)
+    logger.info('Deleted %s %s', deleted, model._meta.verbose_name_plural)
+    return deleted
@@ -0,0 +1,422 @@
+"""
+Cache backends shared between processes.
+
+``TieredCache`` keeps a small in-process LRU (L1) in front of a shared
+cache alias (L2) such as Redis. Writes and deletes are appended to an
+invalidation log stored in L2, which every process replays to drop stale
+L1 entries. ``get_or_compute`` adds stampede protection: one caller per
+key recomputes (single flight), and entries are refreshed slightly before
+they expire with probability growing as expiry nears (XFetch).
+
+``SQLiteCache`` is a shared L2 for development and tests: a SQLite file
+that every process on the host can open.
+"""
+import math
+import os
+import pickle
+import random
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+LOG_COUNTER = 'tiered:log'
+LOG_ENTRY = 'tiered:log:{}'
+LOCK_KEY = 'tiered:lock:{}'
+
+# Django builds a cache instance per thread; the L1 is shared by all of them.
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+class LocalStore:
+    def __init__(self):
+        self.origin = uuid.uuid4().hex
+        self.entries = OrderedDict()
+        self.lock = threading.RLock()
+        self.flights = {}
+        self.cursor = None
+        self.polled = 0
+
+
+class SQLiteCache(BaseCache):
+    def __init__(self, location, params):
+        super().__init__(params)
+        self._path = location
+        self._local = threading.local()
+        self._writes = 0
+
+    def _db(self):
+        # Connections are per thread and per process, so forked workers reconnect.
+        db = getattr(self._local, 'db', None)
+        if db is None or self._local.pid != os.getpid():
+            db = sqlite3.connect(self._path, timeout=30, isolation_level=None, check_same_thread=False)
+            db.execute('PRAGMA journal_mode=WAL')
+            db.execute('PRAGMA synchronous=NORMAL')
+            db.execute('CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value BLOB NOT NULL, expires REAL)')
+            self._local.db, self._local.pid = db, os.getpid()
+        return db
+
+    def _key(self, key, version):
+        key = self.make_key(key, version)
+        self.validate_key(key)
+        return key
+
+    def _expired(self, expires):
+        return expires is not None and expires <= time.time()
+
+    def _written(self):
+        self._writes += 1
+        if self._max_entries and self._writes % 100 == 0:
+            self._cull()
+
+    def _cull(self):
+        db = self._db()
+        db.execute('DELETE FROM cache WHERE expires <= ?', (time.time(),))
+        count = db.execute('SELECT COUNT(*) FROM cache').fetchone()[0]
+        if count > self._max_entries:
+            excess = count // self._cull_frequency if self._cull_frequency else count
+            db.execute('DELETE FROM cache WHERE key IN (SELECT key FROM cache ORDER BY expires LIMIT ?)', (excess,))
+
+    def get(self, key, default=None, version=None):
+        row = self._db().execute('SELECT value, expires FROM cache WHERE key = ?',
+                                 (self._key(key, version),)).fetchone()
+        if row is None or self._expired(row[1]):
+            return default
+        return pickle.loads(row[0])
+
+    def get_many(self, keys, version=None):
+        made = {self._key(key, version): key for key in keys}
+        if not made:
+            return {}
+        rows = self._db().execute(f'SELECT key, value, expires FROM cache WHERE key IN ({", ".join("?" * len(made))})',
+                                  list(made)).fetchall()
+        return {made[key]: pickle.loads(value) for key, value, expires in rows if not self._expired(expires)}
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self._db().execute('INSERT OR REPLACE INTO cache (key, value, expires) VALUES (?, ?, ?)',
+                           (self._key(key, version), pickle.dumps(value, pickle.HIGHEST_PROTOCOL),
+                            self.get_backend_timeout(timeout)))
+        self._written()
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        expires = self.get_backend_timeout(timeout)
+        rows = [(self._key(key, version), pickle.dumps(value, pickle.HIGHEST_PROTOCOL), expires)
+                for key, value in data.items()]
+        db = self._db()
+        db.execute('BEGIN IMMEDIATE')
+        try:
+            db.executemany('INSERT OR REPLACE INTO cache (key, value, expires) VALUES (?, ?, ?)', rows)
+        except BaseException:
+            db.execute('ROLLBACK')
+            raise
+        db.execute('COMMIT')
+        self._written()
+        return []
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        cursor = self._db().execute(
+            'INSERT INTO cache (key, value, expires) VALUES (?, ?, ?) '
+            'ON CONFLICT (key) DO UPDATE SET value = excluded.value, expires = excluded.expires '
+            'WHERE cache.expires IS NOT NULL AND cache.expires <= ?',
+            (self._key(key, version), pickle.dumps(value, pickle.HIGHEST_PROTOCOL),
+             self.get_backend_timeout(timeout), time.time()))
+        self._written()
+        return cursor.rowcount > 0
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        cursor = self._db().execute('UPDATE cache SET expires = ? WHERE key = ? AND (expires IS NULL OR expires > ?)',
+                                    (self.get_backend_timeout(timeout), self._key(key, version), time.time()))
+        return cursor.rowcount > 0
+
+    def incr(self, key, delta=1, version=None):
+        key = self._key(key, version)
+        db = self._db()
+        db.execute('BEGIN IMMEDIATE')
+        try:
+            row = db.execute('SELECT value, expires FROM cache WHERE key = ?', (key,)).fetchone()
+            if row is None or self._expired(row[1]):
+                raise ValueError(f"Key '{key}' not found")
+            value = pickle.loads(row[0]) + delta
+            db.execute('UPDATE cache SET value = ? WHERE key = ?', (pickle.dumps(value, pickle.HIGHEST_PROTOCOL), key))
+        except BaseException:
+            db.execute('ROLLBACK')
+            raise
+        db.execute('COMMIT')
+        return value
+
+    def delete(self, key, version=None):
+        return self._db().execute('DELETE FROM cache WHERE key = ?', (self._key(key, version),)).rowcount > 0
+
+    def delete_many(self, keys, version=None):
+        made = [self._key(key, version) for key in keys]
+        if made:
+            self._db().execute(f'DELETE FROM cache WHERE key IN ({", ".join("?" * len(made))})', made)
+
+    def has_key(self, key, version=None):
+        row = self._db().execute('SELECT expires FROM cache WHERE key = ?', (self._key(key, version),)).fetchone()
+        return row is not None and not self._expired(row[0])
+
+    def clear(self):
+        self._db().execute('DELETE FROM cache')
+
+    def close(self, **kwargs):
+        # Keep the connection open between requests, as the database backends do.
+        pass
+
+
+class TieredCache(BaseCache):
+    """
+    OPTIONS: ``SHARED`` -- the L2 cache alias; ``MAX_ENTRIES`` -- L1 size;
+    ``LOCAL_TIMEOUT`` -- the longest an L1 entry is trusted; ``POLL_INTERVAL``
+    -- how often the invalidation log is replayed; ``LOG_TIMEOUT`` -- how
+    long log entries are kept; ``LOCK_TIMEOUT`` -- the single-flight lock TTL.
+    """
+
+    _missing = object()
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self._shared_alias = options.get('SHARED', 'shared')
+        self._local_timeout = options.get('LOCAL_TIMEOUT', 5)
+        self._poll_interval = options.get('POLL_INTERVAL', 1)
+        self._log_timeout = options.get('LOG_TIMEOUT', 300)
+        self._lock_timeout = options.get('LOCK_TIMEOUT', 10)
+        with _stores_lock:
+            self._store = _stores.setdefault((location, self._shared_alias), LocalStore())
+
+    @property
+    def shared(self):
+        return caches[self._shared_alias]
+
+    # L1
+
+    def _local_get(self, key):
+        with self._store.lock:
+            entry = self._store.entries.get(key)
+            if entry is None:
+                return None
+            value, expires = entry
+            if expires <= time.monotonic():
+                del self._store.entries[key]
+                return None
+            self._store.entries.move_to_end(key)
+            return entry
+
+    def _local_set(self, key, value, timeout):
+        if timeout is DEFAULT_TIMEOUT:
+            timeout = self.default_timeout
+        lifetime = self._local_timeout if timeout is None else min(self._local_timeout, timeout)
+        if lifetime <= 0:
+            self._local_delete([key])
+            return
+        with self._store.lock:
+            self._store.entries[key] = (value, time.monotonic() + lifetime)
+            self._store.entries.move_to_end(key)
+            while len(self._store.entries) > self._max_entries:
+                self._store.entries.popitem(last=False)
+
+    def _local_delete(self, keys):
+        with self._store.lock:
+            for key in keys:
+                self._store.entries.pop(key, None)
+
+    def _local_clear(self):
+        with self._store.lock:
+            self._store.entries.clear()
+
+    # Invalidation log
+
+    def _publish(self, keys):
+        """Tell the other processes to drop ``keys`` (None for everything) from their L1."""
+        keys = [None] if keys is None else list(keys)
+        shared = self.shared
+        try:
+            last = shared.incr(LOG_COUNTER, len(keys))
+        except ValueError:
+            shared.add(LOG_COUNTER, 0, None)
+            last = shared.incr(LOG_COUNTER, len(keys))
+        first = last - len(keys) + 1
+        shared.set_many({LOG_ENTRY.format(first + offset): (self._store.origin, key) for offset, key in enumerate(keys)},
+                        self._log_timeout)
+
+    def _poll(self):
+        now = time.monotonic()
+        if now - self._store.polled < self._poll_interval:
+            return
+        self._store.polled = now
+        latest = self.shared.get(LOG_COUNTER, 0)
+        cursor, self._store.cursor = self._store.cursor, latest
+        if cursor is None or latest == cursor:
+            return
+        if latest < cursor:
+            # The shared cache was flushed.
+            self._local_clear()
+            return
+        names = [LOG_ENTRY.format(number) for number in range(cursor + 1, latest + 1)]
+        entries = self.shared.get_many(names)
+        if len(entries) < len(names):
+            # Part of the log has expired; nothing in L1 can be trusted.
+            self._local_clear()
+            return
+        foreign = [key for origin, key in entries.values() if origin != self._store.origin]
+        if None in foreign:
+            self._local_clear()
+        else:
+            self._local_delete(foreign)
+
+    # Cache API
+
+    def get(self, key, default=None, version=None):
+        self._poll()
+        made = self.make_key(key, version)
+        entry = self._local_get(made)
+        if entry is not None:
+            return entry[0]
+        value = self.shared.get(key, self._missing, version=version)
+        if value is self._missing:
+            return default
+        self._local_set(made, value, None)
+        return value
+
+    def get_many(self, keys, version=None):
+        self._poll()
+        found, missing = {}, []
+        for key in keys:
+            entry = self._local_get(self.make_key(key, version))
+            if entry is None:
+                missing.append(key)
+            else:
+                found[key] = entry[0]
+        if missing:
+            fetched = self.shared.get_many(missing, version=version)
+            for key, value in fetched.items():
+                self._local_set(self.make_key(key, version), value, None)
+            found.update(fetched)
+        return found
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self.shared.set(key, value, timeout, version=version)
+        made = self.make_key(key, version)
+        self._local_set(made, value, timeout)
+        self._publish([made])
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        failed = self.shared.set_many(data, timeout, version=version)
+        made = [self.make_key(key, version) for key in data]
+        for key, value in zip(made, data.values()):
+            self._local_set(key, value, timeout)
+        self._publish(made)
+        return failed
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        added = self.shared.add(key, value, timeout, version=version)
+        if added:
+            made = self.make_key(key, version)
+            self._local_set(made, value, timeout)
+            self._publish([made])
+        return added
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        return self.shared.touch(key, timeout, version=version)
+
+    def incr(self, key, delta=1, version=None):
+        value = self.shared.incr(key, delta, version=version)
+        made = self.make_key(key, version)
+        self._local_delete([made])
+        self._publish([made])
+        return value
+
+    def delete(self, key, version=None):
+        deleted = self.shared.delete(key, version=version)
+        made = self.make_key(key, version)
+        self._local_delete([made])
+        self._publish([made])
+        return deleted
+
+    def delete_many(self, keys, version=None):
+        keys = list(keys)
+        self.shared.delete_many(keys, version=version)
+        made = [self.make_key(key, version) for key in keys]
+        self._local_delete(made)
+        if made:
+            self._publish(made)
+
+    def has_key(self, key, version=None):
+        self._poll()
+        return self._local_get(self.make_key(key, version)) is not None or self.shared.has_key(key, version=version)
+
+    def clear(self):
+        self.shared.clear()
+        self._local_clear()
+        self._publish(None)
+
+    def close(self, **kwargs):
+        self.shared.close(**kwargs)
+
+    # Stampede protection
+
+    def get_or_compute(self, key, compute, timeout=DEFAULT_TIMEOUT, version=None, beta=1.0):
+        """
+        Return the cached value of ``key``, calling ``compute()`` to fill it.
+
+        Only one caller per key computes at a time: other threads in the
+        process wait for it, other processes poll L2 until the lock expires.
+        A value is recomputed early with probability rising towards its
+        expiry, scaled by how long it took to compute. ``compute`` may
+        return None to skip caching. Keys filled this way must only be
+        read through this method.
+        """
+        if timeout is DEFAULT_TIMEOUT:
+            timeout = self.default_timeout
+        stored = self.get(key, version=version)
+        if stored is not None:
+            value, delta, expires = stored
+            if expires is None or time.time() - delta * beta * math.log(1 - random.random()) < expires:
+                return value
+        lock_key = LOCK_KEY.format(self.make_key(key, version))
+
+        with self._store.lock:
+            flight = self._store.flights.get(lock_key)
+            leader = flight is None
+            if leader:
+                flight = self._store.flights[lock_key] = threading.Event()
+        if not leader:
+            if stored is not None:
+                return stored[0]
+            flight.wait(self._lock_timeout)
+            stored = self.get(key, version=version)
+            return stored[0] if stored is not None else compute()
+
+        try:
+            owner = self.shared.add(lock_key, self._store.origin, self._lock_timeout)
+            if not owner:
+                if stored is not None:
+                    return stored[0]
+                deadline = time.monotonic() + self._lock_timeout
+                while time.monotonic() < deadline:
+                    time.sleep(0.05)
+                    stored = self.shared.get(key, version=version)
+                    if stored is not None:
+                        self._local_set(self.make_key(key, version), stored, timeout)
+                        return stored[0]
+            try:
+                started = time.time()
+                value = compute()
+                delta = time.time() - started
+                if value is not None:
+                    self.set(key, (value, delta, None if timeout is None else time.time() + timeout),
+                             timeout, version=version)
+                return value
+            finally:
+                if owner:
+                    self.shared.delete(lock_key)
+        finally:
+            with self._store.lock:
+                del self._store.flights[lock_key]
+            flight.set()
@@ -0,0 +1,110 @@
+"""
+On-the-fly compression of dynamic responses.
+
+Pages and JSON are compressed with brotli when the package is installed and
+the client accepts it, else with gzip. Bodies below COMPRESSION_MIN_SIZE
+are sent as they are. Streaming responses are compressed chunk by chunk and
+every chunk is flushed, so a page whose head is streamed first still
+reaches the browser early. Static files are served precompressed by
+StaticFilesMiddleware and carry a Content-Encoding, which is left alone.
+"""
+import zlib
+
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+
+from .staticfiles import accepts, brotli
+
+COMPRESSIBLE_TYPES = ('text/', 'application/json', 'application/javascript', 'application/xml',
+                      'image/svg+xml')
+
+
+class GzipCompressor:
+    def __init__(self):
+        # wbits=31 writes the gzip header and trailer.
+        self.compressor = zlib.compressobj(settings.COMPRESSION_GZIP_LEVEL, zlib.DEFLATED, 31)
+
+    def compress(self, data):
+        return self.compressor.compress(data)
+
+    def flush(self):
+        return self.compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        return self.compressor.flush()
+
+
+class BrotliCompressor:
+    def __init__(self):
+        self.compressor = brotli.Compressor(quality=settings.COMPRESSION_BROTLI_QUALITY)
+
+    def compress(self, data):
+        return self.compressor.process(data)
+
+    def flush(self):
+        return self.compressor.flush()
+
+    def finish(self):
+        return self.compressor.finish()
+
+
+COMPRESSORS = {'gzip': GzipCompressor}
+if brotli is not None:
+    COMPRESSORS = {'br': BrotliCompressor, **COMPRESSORS}
+
+
+def negotiate(request):
+    """The preferred encoding among those the client accepts, or None."""
+    return next((encoding for encoding in COMPRESSORS if accepts(request, encoding)), None)
+
+
+def compress_bytes(data, encoding):
+    compressor = COMPRESSORS[encoding]()
+    return compressor.compress(data) + compressor.finish()
+
+
+def compress_stream(chunks, encoding):
+    compressor = COMPRESSORS[encoding]()
+    for chunk in chunks:
+        data = compressor.compress(chunk) + compressor.flush()
+        if data:
+            yield data
+    yield compressor.finish()
+
+
+class CompressionMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        return self.compress(request, self.get_response(request))
+
+    def compress(self, request, response):
+        if response.has_header('Content-Encoding'):
+            return response
+        if not response.get('Content-Type', '').startswith(COMPRESSIBLE_TYPES):
+            return response
+        size = response.get('Content-Length') if response.streaming else len(response.content)
+        if size is not None and int(size) < settings.COMPRESSION_MIN_SIZE:
+            return response
+        patch_vary_headers(response, ('Accept-Encoding',))
+        encoding = negotiate(request)
+        if encoding is None:
+            return response
+
+        if response.streaming:
+            response.streaming_content = compress_stream(response.streaming_content, encoding)
+            del response['Content-Length']
+        else:
+            compressed = compress_bytes(response.content, encoding)
+            if len(compressed) >= len(response.content):
+                return response
+            response.content = compressed
+            response['Content-Length'] = str(len(compressed))
+
+        # The encoded body is not byte-for-byte the one the strong ETag was computed for.
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response['ETag'] = 'W/' + etag
+        response['Content-Encoding'] = encoding
+        return response
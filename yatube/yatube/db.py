@@ -0,0 +1,103 @@
+"""
+Primary/replica routing.
+
+Views marked with ``read_replica`` read from ``DATABASE_REPLICAS``;
+everything else, every write, and every read inside a transaction goes to
+the primary. A request that writes pins the client to the primary for
+``REPLICA_PIN_SECONDS`` with a cookie, so it reads its own writes while
+the replicas catch up.
+"""
+import random
+import time
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+PIN_COOKIE = 'db_pin'
+
+_route = ContextVar('database_route', default=None)
+
+
+class Route:
+    def __init__(self, pinned):
+        self.pinned = pinned
+        self.replica = False
+        self.wrote = False
+
+
+def read_replica(view):
+    """Let the view read from a replica unless the client is pinned to the primary."""
+    view.read_replica = True
+    return view
+
+
+class PrimaryReplicaRouter:
+    def db_for_read(self, model, **hints):
+        route = _route.get()
+        if route is None or not route.replica or route.pinned or not settings.DATABASE_REPLICAS:
+            return DEFAULT_DB_ALIAS
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return random.choice(settings.DATABASE_REPLICAS)
+
+    def db_for_write(self, model, **hints):
+        route = _route.get()
+        if route is not None:
+            route.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db not in settings.DATABASE_REPLICAS
+
+
+def check_connections():
+    """
+    Close persistent connections that sat idle long enough for the server
+    to have dropped them (Django 4.0 has no CONN_HEALTH_CHECKS).
+    """
+    now = time.monotonic()
+    for connection in connections.all():
+        idle_since = getattr(connection, 'idle_since', None)
+        if connection.connection is None or idle_since is None:
+            continue
+        if now - idle_since > settings.DATABASE_HEALTH_CHECK_AFTER and not connection.is_usable():
+            connection.close()
+
+
+def mark_idle():
+    now = time.monotonic()
+    for connection in connections.all():
+        if connection.connection is not None:
+            connection.idle_since = now
+
+
+class DatabaseRoutingMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        check_connections()
+        try:
+            pinned = float(request.COOKIES.get(PIN_COOKIE, 0)) > time.time()
+        except ValueError:
+            pinned = False
+        route = Route(pinned)
+        token = _route.set(route)
+        try:
+            response = self.get_response(request)
+        finally:
+            _route.reset(token)
+            mark_idle()
+        if route.wrote and settings.DATABASE_REPLICAS:
+            response.set_cookie(PIN_COOKIE, str(int(time.time() + settings.REPLICA_PIN_SECONDS)),
+                                max_age=settings.REPLICA_PIN_SECONDS, httponly=True, samesite='Lax')
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        route = _route.get()
+        if route is not None:
+            route.replica = getattr(view_func, 'read_replica', False)
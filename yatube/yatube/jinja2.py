@@ -0,0 +1,74 @@
+"""
+Environment for the optional Jinja2 engine (YATUBE_TEMPLATES=jinja2).
+
+The templates in jinja2/ are ports of the feed pages; they share the card
+cache, the image tags and the form filters with the Django templates.
+"""
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.template.backends import jinja2 as jinja2_backend
+from django.template.defaultfilters import linebreaksbr, truncatewords
+from django.test.signals import template_rendered
+from django.urls import reverse
+from django.utils import formats, timezone
+from django.utils.safestring import SafeData, mark_safe
+from jinja2 import ChainableUndefined, Environment
+
+from posts.templatetags.post_cards import card_picture, card_thumbnail, render_cards
+from users.templatetags.user_filters import add_class
+
+
+def url(name, *args, **kwargs):
+    return reverse(name, args=args or None, kwargs=kwargs or None)
+
+
+def localize(value):
+    """What ``{{ value }}`` prints in a Django template: local time, localized format."""
+    return formats.localize(timezone.template_localtime(value))
+
+
+def truncate_words(value, length):
+    # Like the Django filter, truncating keeps markup from linebreaksbr safe.
+    result = truncatewords(value, length)
+    return mark_safe(result) if isinstance(value, SafeData) else result
+
+
+def environment(**options):
+    # Missing variables and their attributes render as '', as in Django templates.
+    env = Environment(**{**options, 'undefined': ChainableUndefined})
+    env.globals.update({
+        'static': staticfiles_storage.url,
+        'url': url,
+        'post_cards': render_cards,
+        'card_picture': card_picture,
+        'card_thumbnail': card_thumbnail,
+    })
+    env.filters.update({
+        'add_class': add_class,
+        'linebreaksbr': linebreaksbr,
+        'truncatewords': truncate_words,
+        'localize': localize,
+    })
+    return env
+
+
+class Template(jinja2_backend.Template):
+    """
+    Sends ``template_rendered`` like Django templates do under tests, so the
+    test client records ``response.context`` and ``response.templates``.
+    """
+
+    @property
+    def name(self):
+        return self.template.name
+
+    def render(self, context=None, request=None):
+        template_rendered.send(sender=self, template=self, context=context or {})
+        return super().render(context, request)
+
+
+class Jinja2(jinja2_backend.Jinja2):
+    def from_string(self, template_code):
+        return Template(super().from_string(template_code).template, self)
+
+    def get_template(self, template_name):
+        return Template(super().get_template(template_name).template, self)
@@ -37,6 +37,9 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'yatube.compression.CompressionMiddleware',
+    'yatube.staticfiles.StaticFilesMiddleware',
+    'yatube.db.DatabaseRoutingMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -44,6 +47,7 @@ MIDDLEWARE = [
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'debug_toolbar.middleware.DebugToolbarMiddleware',
+    'posts.budgets.QueryBudgetMiddleware',
 ]
 
 ROOT_URLCONF = 'yatube.urls'
@@ -65,15 +69,84 @@ TEMPLATES = [
     },
 ]
 
+# YATUBE_TEMPLATES=cached parses every template once per process, when the
+# app starts, even with DEBUG on; =jinja2 also serves the feed pages from
+# the ports in jinja2/ (needs the jinja2 package), everything else stays on
+# the Django engine.
+TEMPLATE_MODE = os.environ.get('YATUBE_TEMPLATES', 'debug')
+TEMPLATE_PRECOMPILE = TEMPLATE_MODE in ('cached', 'jinja2')
+CACHED_TEMPLATE_LOADERS = [
+    ('django.template.loaders.cached.Loader', [
+        'django.template.loaders.filesystem.Loader',
+        'django.template.loaders.app_directories.Loader',
+    ]),
+]
+JINJA2_TEMPLATES = {
+    'BACKEND': 'yatube.jinja2.Jinja2',
+    'DIRS': [BASE_DIR / 'jinja2'],
+    'APP_DIRS': False,
+    'OPTIONS': {
+        'environment': 'yatube.jinja2.environment',
+        'auto_reload': False,
+        'context_processors': [
+            'django.contrib.auth.context_processors.auth',
+            'django.contrib.messages.context_processors.messages',
+        ],
+    },
+}
+if TEMPLATE_PRECOMPILE:
+    TEMPLATES[0]['APP_DIRS'] = False
+    TEMPLATES[0]['OPTIONS']['loaders'] = CACHED_TEMPLATE_LOADERS
+if TEMPLATE_MODE == 'jinja2':
+    TEMPLATES.insert(0, JINJA2_TEMPLATES)
+
 WSGI_APPLICATION = 'yatube.wsgi.application'
 
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / "db.sqlite3",
+        'CONN_MAX_AGE': 60,
     }
 }
 
+# Read replicas, as a comma-separated list of SQLite files kept in sync with
+# the primary. Under test they mirror the default database.
+DATABASE_REPLICAS = []
+for number, name in enumerate(filter(None, os.environ.get('YATUBE_DB_REPLICAS', '').split(',')), 1):
+    DATABASES[f'replica{number}'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': name,
+        'CONN_MAX_AGE': 60,
+        'TEST': {'MIRROR': 'default'},
+    }
+    DATABASE_REPLICAS.append(f'replica{number}')
+
+DATABASE_ROUTERS = ['yatube.db.PrimaryReplicaRouter']
+
+# How long a client that wrote reads from the primary only.
+REPLICA_PIN_SECONDS = 5
+
+# Persistent connections idle for longer than this are pinged before reuse.
+DATABASE_HEALTH_CHECK_AFTER = 30
+
+# Tuning for serving straight from SQLite: PRAGMAs on every connection and
+# all writes funnelled through one thread per process.
+SQLITE_TUNING = os.environ.get('YATUBE_SQLITE_TUNING') == '1'
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'mmap_size': 256 * 1024 * 1024,
+    'cache_size': -64 * 1024,
+    'busy_timeout': 5000,
+    'temp_store': 'MEMORY',
+}
+SQLITE_WRITE_QUEUE = SQLITE_TUNING
+if SQLITE_TUNING:
+    for database in DATABASES.values():
+        if database['ENGINE'] == 'django.db.backends.sqlite3':
+            database['ENGINE'] = 'yatube.sqlite'
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
@@ -103,10 +176,25 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'static')
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# manage.py build_assets compiles assets/src (against the sources in
+# assets/vendor) into assets/build.
+ASSETS_DIR = BASE_DIR / 'assets'
 STATICFILES_DIRS = [
-    BASE_DIR / 'posts/static/',
+    ASSETS_DIR / 'build',
 ]
 
+# YATUBE_STATIC_MANIFEST=1: collectstatic writes content-hashed names with
+# .gz/.br siblings, and hashed files are served as immutable for a year.
+if os.environ.get('YATUBE_STATIC_MANIFEST') == '1':
+    STATICFILES_STORAGE = 'yatube.staticfiles.CompressedManifestStaticFilesStorage'
+STATIC_IMMUTABLE_MAX_AGE = 60 * 60 * 24 * 365
+STATIC_MAX_AGE = 60
+
+# Dynamic responses are compressed with brotli or gzip from this size up.
+COMPRESSION_MIN_SIZE = 1024
+COMPRESSION_GZIP_LEVEL = 6
+COMPRESSION_BROTLI_QUALITY = 5
+
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 LOGIN_URL = "/auth/login/"
@@ -126,3 +214,75 @@ CACHES = {
         'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
     }
 }
+
+# Point YATUBE_SHARED_CACHE at a redis:// URL (or a SQLite file on a single
+# host) to share the cache between worker processes, with a small
+# in-process LRU in front of it.
+SHARED_CACHE = os.environ.get('YATUBE_SHARED_CACHE')
+if SHARED_CACHE:
+    CACHES = {
+        'default': {
+            'BACKEND': 'yatube.cache.TieredCache',
+            'OPTIONS': {'SHARED': 'shared', 'MAX_ENTRIES': 1000, 'LOCAL_TIMEOUT': 5, 'POLL_INTERVAL': 1},
+        },
+        'shared': {
+            'BACKEND': ('django.core.cache.backends.redis.RedisCache'
+                        if SHARED_CACHE.startswith(('redis://', 'rediss://', 'unix://'))
+                        else 'yatube.cache.SQLiteCache'),
+            'LOCATION': SHARED_CACHE,
+        },
+    }
+
+# Session users come from the cache; the signals drop them when they change.
+# ModelBackend stays for sessions logged in before the cache was added.
+AUTHENTICATION_BACKENDS = [
+    'users.backends.CachedModelBackend',
+    'django.contrib.auth.backends.ModelBackend',
+]
+USER_CACHE_TIMEOUT = 60 * 15
+
+# YATUBE_SESSIONS=cache keeps sessions in the cache and writes them through
+# to the database; =cookie keeps every visitor's session, logged in or not,
+# in signed cookies, with no storage.
+SESSION_MODE = os.environ.get('YATUBE_SESSIONS', 'db')
+if SESSION_MODE == 'cache':
+    SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'
+    if SHARED_CACHE:
+        # Not through the in-process tier: a worker must see a login or logout at once.
+        SESSION_CACHE_ALIAS = 'shared'
+elif SESSION_MODE == 'cookie':
+    SESSION_ENGINE = 'django.contrib.sessions.backends.signed_cookies'
+
+# Feed pages are invalidated by signals, so the TTL only bounds memory use.
+FEED_CACHE_TIMEOUT = 60 * 60 * 6
+
+CARD_CACHE_TIMEOUT = 60 * 60 * 24
+
+# YATUBE_STREAM_PAGES=1 streams the index, group and profile pages: the
+# head, navigation and menu go out first, the post cards follow a few at a time.
+STREAM_FEED_PAGES = os.environ.get('YATUBE_STREAM_PAGES') == '1'
+STREAM_CARDS_PER_CHUNK = 3
+# Streamed responses up to this size are cached once sent.
+STREAM_CACHE_MAX_SIZE = 1024 * 1024
+
+# How long the edge may serve anonymous feed pages without revalidating,
+# and for how much longer it may serve them stale while it does.
+EDGE_CACHE_SECONDS = 60
+EDGE_STALE_SECONDS = 60 * 5
+
+# Authors with more followers than this are not fanned out on write;
+# their posts are merged into follow feeds at read time instead.
+FEED_FANOUT_LIMIT = 1000
+FEED_BACKFILL_LIMIT = 200
+
+# In-process worker pool for jobs moved off the request path (image processing).
+BACKGROUND_WORKERS = 2
+BACKGROUND_TASKS_EAGER = False
+
+# Worker processes for building responsive image variants; 0 runs inline.
+IMAGE_WORKERS = 2
+
+THUMBNAIL_BACKEND = 'posts.thumbnails.QueuedThumbnailBackend'
+
+# Serve the feed views from posts.async_views; yatube/asgi.py turns this on.
+ASYNC_VIEWS = os.environ.get('YATUBE_ASYNC_VIEWS') == '1'
@@ -0,0 +1,91 @@
+"""
+A single writer thread per process for SQLite.
+
+SQLite allows one writer at a time, so concurrent requests that write
+queue up on the database lock and eventually fail with "database is
+locked". With ``SQLITE_WRITE_QUEUE`` on, ``write()`` hands the work to one
+thread that runs queued jobs back to back in short transactions, each job
+in its own savepoint so a failing one does not undo the others.
+"""
+import contextvars
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+from django.conf import settings
+from django.db import connection, transaction
+
+BATCH_SIZE = 50
+# How long the writer waits for more jobs before committing a batch.
+LINGER = 0.002
+
+
+class WriteQueue:
+    def __init__(self, batch_size=BATCH_SIZE, linger=LINGER):
+        self.batch_size = batch_size
+        self.linger = linger
+        self.jobs = queue.Queue()
+        self.thread = None
+        self.lock = threading.Lock()
+        self.batches = []
+
+    def submit(self, func, *args, **kwargs):
+        """Run ``func`` on the writer thread and return its result or raise its exception."""
+        future = Future()
+        # In the caller's context, so the job's writes are seen by its request (the router marks the route).
+        context = contextvars.copy_context()
+        self.jobs.put((context.run, (func, *args), kwargs, future))
+        with self.lock:
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self.run, name='sqlite-writer', daemon=True)
+                self.thread.start()
+        return future.result()
+
+    def take_batch(self):
+        batch = [self.jobs.get()]
+        deadline = time.monotonic() + self.linger
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self.jobs.get(timeout=max(0, deadline - time.monotonic())))
+            except queue.Empty:
+                break
+        return batch
+
+    def run(self):
+        while True:
+            batch = self.take_batch()
+            outcomes = []
+            try:
+                with transaction.atomic():
+                    for func, args, kwargs, future in batch:
+                        try:
+                            with transaction.atomic():
+                                outcomes.append((future, func(*args, **kwargs), None))
+                        except Exception as error:
+                            outcomes.append((future, None, error))
+            except Exception as error:
+                outcomes = [(future, None, error) for _, _, _, future in batch]
+            self.batches.append(len(batch))
+            del self.batches[:-100]
+            for future, result, error in outcomes:
+                if error is None:
+                    future.set_result(result)
+                else:
+                    future.set_exception(error)
+
+
+writer = WriteQueue()
+
+
+def write(func, *args, **kwargs):
+    """
+    Run a unit of writes, through the writer thread when ``SQLITE_WRITE_QUEUE``
+    is on. Inside an open transaction the caller's connection is used, since
+    the writer could not see its uncommitted rows.
+    """
+    if (not settings.SQLITE_WRITE_QUEUE or connection.in_atomic_block
+            or threading.current_thread() is writer.thread):
+        with transaction.atomic():
+            return func(*args, **kwargs)
+    return writer.submit(func, *args, **kwargs)
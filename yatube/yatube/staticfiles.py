@@ -0,0 +1,120 @@
+"""
+Static files for production: content-hashed names, precompressed copies
+and long-lived caching.
+
+collectstatic with CompressedManifestStaticFilesStorage writes every file
+under its hashed name plus ``.gz`` and ``.br`` siblings of the text ones;
+StaticFilesMiddleware serves STATIC_ROOT from the app server, choosing the
+sibling the client accepts. A front server can do the same with
+``gzip_static``/``brotli_static`` and the manifest's hashed names.
+"""
+import gzip
+import mimetypes
+import os
+import re
+
+from django.conf import settings
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage, staticfiles_storage
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, HttpResponseNotModified
+from django.utils._os import safe_join
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.utils.functional import cached_property
+from django.utils.http import http_date
+from django.views.static import was_modified_since
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSIBLE = ('.css', '.js', '.map', '.svg', '.json', '.txt', '.html', '.xml')
+# Smaller files do not get smaller.
+MIN_SIZE = 256
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+
+def compress(path):
+    """Write the .gz (and, with brotli installed, .br) siblings of ``path`` when they are smaller."""
+    with open(path, 'rb') as file:
+        data = file.read()
+    if len(data) < MIN_SIZE:
+        return
+    variants = {'.gz': gzip.compress(data, 9, mtime=0)}
+    if brotli is not None:
+        variants['.br'] = brotli.compress(data, quality=11)
+    for suffix, compressed in variants.items():
+        if len(compressed) < len(data):
+            with open(path + suffix, 'wb') as file:
+                file.write(compressed)
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    def post_process(self, paths, dry_run=False, **options):
+        processed = []
+        for name, hashed_name, done in super().post_process(paths, dry_run, **options):
+            if hashed_name and not isinstance(done, Exception):
+                processed.extend([name, hashed_name])
+            yield name, hashed_name, done
+        if dry_run:
+            return
+        for name in set(processed):
+            if name.endswith(COMPRESSIBLE) and self.exists(name):
+                compress(self.path(name))
+
+
+def accepts(request, encoding):
+    for part in request.headers.get('Accept-Encoding', '').split(','):
+        token, _, params = part.strip().partition(';')
+        if token.strip() == encoding:
+            return not re.match(r'\s*q=0(\.0*)?\s*$', params)
+    return False
+
+
+class StaticFilesMiddleware:
+    """
+    Serve files under STATIC_URL from STATIC_ROOT, precompressed when the
+    client accepts it. Hashed names never change, so they are cached for a
+    year as immutable; other files for STATIC_MAX_AGE.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.prefix = '/' + settings.STATIC_URL.lstrip('/')
+
+    @cached_property
+    def hashed_names(self):
+        return set(getattr(staticfiles_storage, 'hashed_files', {}).values())
+
+    def __call__(self, request):
+        if request.method in ('GET', 'HEAD') and request.path_info.startswith(self.prefix) and settings.STATIC_ROOT:
+            response = self.serve(request, request.path_info[len(self.prefix):])
+            if response is not None:
+                return response
+        return self.get_response(request)
+
+    def serve(self, request, name):
+        try:
+            path = safe_join(settings.STATIC_ROOT, name)
+        except SuspiciousFileOperation:
+            return None
+        if not os.path.isfile(path):
+            return None
+        stat = os.stat(path)
+        if not was_modified_since(request.headers.get('If-Modified-Since'), stat.st_mtime):
+            return HttpResponseNotModified()
+        content_type, _ = mimetypes.guess_type(name)
+        variants = {encoding: path + suffix for encoding, suffix in ENCODINGS if os.path.isfile(path + suffix)}
+        encoding = next((encoding for encoding in variants if accepts(request, encoding)), None)
+        response = FileResponse(open(variants.get(encoding, path), 'rb'),
+                                content_type=content_type or 'application/octet-stream')
+        if encoding is not None:
+            response['Content-Encoding'] = encoding
+        if variants:
+            patch_vary_headers(response, ['Accept-Encoding'])
+        response['Last-Modified'] = http_date(stat.st_mtime)
+        if name in self.hashed_names:
+            patch_cache_control(response, public=True, max_age=settings.STATIC_IMMUTABLE_MAX_AGE, immutable=True)
+        else:
+            patch_cache_control(response, public=True, max_age=settings.STATIC_MAX_AGE)
+        return response
@@ -0,0 +1,45 @@
+"""
+Parse every template up front, so that no request pays for it.
+
+Django engines are warmed only when they use the cached loader; a Jinja2
+environment keeps compiled templates in its own cache.
+"""
+import logging
+import os
+
+from django.template import TemplateSyntaxError, engines
+from django.template.backends.django import DjangoTemplates
+from django.template.loaders.cached import Loader as CachedLoader
+
+logger = logging.getLogger(__name__)
+
+
+def template_names(backend):
+    if not isinstance(backend, DjangoTemplates):
+        return backend.env.list_templates(filter_func=lambda name: name.endswith('.html'))
+    names = set()
+    for cached in backend.engine.template_loaders:
+        if not isinstance(cached, CachedLoader):
+            continue
+        for loader in cached.loaders:
+            for directory in loader.get_dirs():
+                for root, _, files in os.walk(directory):
+                    names.update(os.path.relpath(os.path.join(root, name), directory).replace(os.sep, '/')
+                                 for name in files if name.endswith('.html'))
+    return sorted(names)
+
+
+def precompile():
+    """Load every ``.html`` template of every engine; returns how many were compiled."""
+    compiled = 0
+    for backend in engines.all():
+        for name in template_names(backend):
+            try:
+                backend.get_template(name)
+            except TemplateSyntaxError as error:
+                # Third-party templates that are only ever included by other engines.
+                logger.warning('Template %s does not compile with %s: %s', name, backend.name, error)
+            else:
+                compiled += 1
+    logger.info('Precompiled %s templates', compiled)
+    return compiled